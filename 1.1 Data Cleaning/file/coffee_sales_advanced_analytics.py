@@ -1,8 +1,9 @@
+import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import LinearRegression, Ridge, Lasso
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
@@ -10,11 +11,25 @@ from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA
 from sklearn.feature_selection import SelectKBest, f_regression
+from coffee_sales_ranking import top_one
+from coffee_sales_basket import MarketBasketAnalyzer
+from coffee_sales_tuning import SuccessiveHalvingTuner
+from coffee_sales_partitions import read_partitioned, filter_rows
+from coffee_sales_out_of_core import write_feature_batches, OutOfCoreTrainer
 import warnings
 warnings.filterwarnings('ignore')
 
+# Features for sales prediction
+SALES_FEATURES = [
+    'transaction_qty', 'unit_price', 'year', 'month', 'day', 'day_of_week',
+    'quarter', 'is_weekend', 'hour', 'store_id', 'product_id',
+    'total_quantity_sold', 'store_total_sales', 'store_avg_sale',
+    'store_transaction_count'
+]
+
 class CoffeeSalesAdvancedAnalytics:
-    def __init__(self):
+    def __init__(self, tune_hyperparameters=False, tuning_budget=300, tuning_workers=None,
+                 retune=False, out_of_core=False, batch_rows=100_000):
         self.data = None
         self.X = None
         self.y = None
@@ -26,11 +41,26 @@ class CoffeeSalesAdvancedAnalytics:
         self.scaler = StandardScaler()
         self.label_encoders = {}
         
-    def load_data(self):
-        """Load the processed coffee sales data"""
+        # Hyperparameter tuning settings (budget in seconds)
+        self.tune = tune_hyperparameters
+        self.tuning_budget = tuning_budget
+        self.tuning_workers = tuning_workers
+        self.retune = retune
+        self.tuned_params = {}
+        self.clustering_features = ['total_spent', 'total_items', 'avg_price', 'unique_products']
+        
+        # Out-of-core training streams float32 feature batches from disk
+        self.out_of_core = out_of_core
+        self.batch_rows = batch_rows
+        
+    def load_data(self, path='coffee_sales_processed.csv', start_date=None, end_date=None, store_ids=None):
+        """Load the processed coffee sales data (CSV file or partitioned dataset directory)"""
         print("📊 Loading processed coffee sales data...")
         try:
-            self.data = pd.read_csv('coffee_sales_processed.csv')
+            if os.path.isdir(path):
+                self.data = read_partitioned(path, start_date, end_date, store_ids)
+            else:
+                self.data = filter_rows(pd.read_csv(path), start_date, end_date, store_ids)
             print(f"✅ Data loaded successfully! Shape: {self.data.shape}")
             return True
         except Exception as e:
@@ -43,12 +73,7 @@ class CoffeeSalesAdvancedAnalytics:
         print("\n🔧 Preparing data for sales prediction...")
         
         # Select features for sales prediction
-        feature_columns = [
-            'transaction_qty', 'unit_price', 'year', 'month', 'day', 'day_of_week',
-            'quarter', 'is_weekend', 'hour', 'store_id', 'product_id',
-            'total_quantity_sold', 'store_total_sales', 'store_avg_sale',
-            'store_transaction_count'
-        ]
+        feature_columns = SALES_FEATURES
         
         # Filter available columns
         available_features = [col for col in feature_columns if col in self.data.columns]
@@ -74,17 +99,64 @@ class CoffeeSalesAdvancedAnalytics:
         print(f"✅ Data prepared! Features: {len(available_features)}, Train: {len(self.X_train)}, Test: {len(self.X_test)}")
         print(f"Average sales amount: ${self.y.mean():.2f}")
     
+    def tune_hyperparameters(self):
+        """Tune model hyperparameters with successive halving under a wall-clock budget"""
+        print(f"\n🎛️ Tuning hyperparameters (budget: {self.tuning_budget}s)...")
+        
+        # Time-series CV needs chronological rows; partitioned input is not necessarily in order
+        if {'transaction_date', 'transaction_time'}.issubset(self.data.columns):
+            rows = self.data.loc[self.X_train.index]
+            dates = pd.to_datetime(rows['transaction_date'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+            times = pd.to_datetime(rows['transaction_time'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+            order = np.lexsort((times.astype(np.int64), dates.astype(np.int64)))
+        else:
+            order = np.argsort(self.X_train.index.to_numpy(), kind='stable')
+        X_raw = self.X_train.to_numpy()[order]
+        X_scaled = self.X_train_scaled[order]
+        y = self.y_train.to_numpy()[order]
+        
+        features = {
+            'Random Forest': X_raw,
+            'Gradient Boosting': X_raw,
+            'Ridge Regression': X_scaled,
+            'Lasso Regression': X_scaled
+        }
+        
+        with SuccessiveHalvingTuner(time_budget=self.tuning_budget, n_workers=self.tuning_workers,
+                                    retune=self.retune) as tuner:
+            # Keep a slice of the budget for the cluster count search
+            self.tuned_params = tuner.tune_models(list(features), features, y, reserve=self.tuning_budget * 0.1,
+                                                  feature_names=list(self.X_train.columns))
+            
+            customer_data = self.build_customer_data()
+            clustering_data = customer_data[self.clustering_features].fillna(customer_data[self.clustering_features].median())
+            self.tuned_params['KMeans'] = tuner.tune_clusters(StandardScaler().fit_transform(clustering_data),
+                                                              feature_names=self.clustering_features)
+        
+        print("✅ Hyperparameter tuning completed!")
+        return self.tuned_params
+    
     def train_sales_prediction_models(self):
         """Train multiple models for sales prediction"""
         print("\n🤖 Training sales prediction models...")
         
+        # Default hyperparameters, overridden by tuned configs when available
+        params = {
+            'Random Forest': {'n_estimators': 100},
+            'Gradient Boosting': {},
+            'Ridge Regression': {'alpha': 1.0},
+            'Lasso Regression': {'alpha': 0.1}
+        }
+        for name in params:
+            params[name].update(self.tuned_params.get(name, {}))
+        
         # Define models
         models = {
-            'Random Forest': RandomForestRegressor(n_estimators=100, random_state=42),
-            'Gradient Boosting': GradientBoostingRegressor(random_state=42),
+            'Random Forest': RandomForestRegressor(random_state=42, **params['Random Forest']),
+            'Gradient Boosting': GradientBoostingRegressor(random_state=42, **params['Gradient Boosting']),
             'Linear Regression': LinearRegression(),
-            'Ridge Regression': Ridge(alpha=1.0),
-            'Lasso Regression': Lasso(alpha=0.1)
+            'Ridge Regression': Ridge(**params['Ridge Regression']),
+            'Lasso Regression': Lasso(**params['Lasso Regression'])
         }
         
         # Train and evaluate models
@@ -121,6 +193,41 @@ class CoffeeSalesAdvancedAnalytics:
         self.models = results
         return results
     
+    def train_out_of_core_models(self, path='coffee_sales_processed.csv', batch_dir='feature_batches', epochs=3):
+        """Train incremental models from float32 feature batches with a time-based holdout"""
+        print("\n💽 Training sales prediction models out-of-core...")
+        
+        # Stream the processed data to disk in float32 batches
+        manifest = write_feature_batches(path, SALES_FEATURES, out_dir=batch_dir, batch_rows=self.batch_rows)
+        total_rows = sum(batch['rows'] for batch in manifest['batches'])
+        print(f"Feature batches written: {len(manifest['batches'])} ({total_rows} rows)")
+        
+        # Scaler and models are updated one batch at a time
+        trainer = OutOfCoreTrainer(batch_dir, epochs=epochs).fit()
+        results = trainer.evaluate()
+        cutoff = pd.Timestamp('1970-01-01') + pd.Timedelta(days=trainer.cutoff_day)
+        test_rows = next(iter(results.values()))['test_rows']
+        print(f"Holdout: {test_rows} transactions from {cutoff.date()} onwards")
+        
+        for name, result in results.items():
+            print(f"  {name} - R²: {result['r2']:.3f}, RMSE: ${result['rmse']:.2f}, MAE: ${result['mae']:.2f}")
+        
+        with open('coffee_sales_out_of_core_report.txt', 'w') as f:
+            f.write("Coffee Sales Out-of-Core Training Report\n")
+            f.write("=" * 40 + "\n\n")
+            f.write(f"Rows: {total_rows}, Batches: {len(manifest['batches'])}, Epochs: {epochs}\n")
+            f.write(f"Holdout: transactions from {cutoff.date()} onwards ({test_rows} rows)\n\n")
+            for name, result in results.items():
+                f.write(f"{name}:\n")
+                f.write(f"  R² Score: {result['r2']:.3f}\n")
+                f.write(f"  RMSE: ${result['rmse']:.2f}\n")
+                f.write(f"  MAE: ${result['mae']:.2f}\n\n")
+        
+        self.models = results
+        self.scaler = trainer.scaler
+        print("✅ Out-of-core training completed!")
+        return results
+    
     def feature_importance_analysis(self):
         """Analyze feature importance for sales prediction"""
         print("\n📈 Analyzing feature importance...")
@@ -144,11 +251,8 @@ class CoffeeSalesAdvancedAnalytics:
         print("✅ Feature importance analysis completed!")
         return feature_importance
     
-    def customer_segmentation(self):
-        """Perform customer segmentation analysis"""
-        print("\n🎯 Performing customer segmentation analysis...")
-        
-        # Create customer-level data
+    def build_customer_data(self):
+        """Aggregate line items to one row per transaction"""
         customer_data = self.data.groupby('transaction_id').agg({
             'total_amount': 'sum',
             'transaction_qty': 'sum',
@@ -161,9 +265,17 @@ class CoffeeSalesAdvancedAnalytics:
         
         customer_data.columns = ['transaction_id', 'total_spent', 'total_items', 'avg_price', 
                                'unique_products', 'store_id', 'day_of_week', 'is_weekend']
+        return customer_data
+    
+    def customer_segmentation(self):
+        """Perform customer segmentation analysis"""
+        print("\n🎯 Performing customer segmentation analysis...")
+        
+        # Create customer-level data
+        customer_data = self.build_customer_data()
         
         # Select features for clustering
-        clustering_features = ['total_spent', 'total_items', 'avg_price', 'unique_products']
+        clustering_features = self.clustering_features
         
         # Prepare clustering data
         clustering_data = customer_data[clustering_features].copy()
@@ -173,7 +285,8 @@ class CoffeeSalesAdvancedAnalytics:
         clustering_data_scaled = StandardScaler().fit_transform(clustering_data)
         
         # Perform K-means clustering
-        kmeans = KMeans(n_clusters=4, random_state=42)
+        n_clusters = self.tuned_params.get('KMeans', {}).get('n_clusters', 4)
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
         clusters = kmeans.fit_predict(clustering_data_scaled)
         
         # Add cluster labels to customer data
@@ -208,6 +321,21 @@ class CoffeeSalesAdvancedAnalytics:
         print("✅ Customer segmentation completed!")
         return cluster_analysis
     
+    def market_basket_analysis(self, top_n=5, min_count=5):
+        """Find products that are bought together in the same transaction"""
+        print("\n🛒 Performing market basket analysis...")
+        
+        analyzer = MarketBasketAnalyzer(basket_col='transaction_id', item_col='product_id')
+        analyzer.fit(self.data)
+        
+        # Top partner products per product, ranked by lift among pairs seen in min_count+ baskets
+        product_pairs = analyzer.top_pairs(k=top_n, metric='lift', min_count=min_count)
+        product_pairs.round(4).to_csv('product_pairs.csv', index=False)
+        
+        print(f"Baskets analyzed: {analyzer.n_baskets}, Products: {len(analyzer.items)}")
+        print(f"✅ Market basket analysis completed! {len(product_pairs)} product pairs exported.")
+        return product_pairs
+    
     def sales_forecasting(self):
         """Create sales forecasting model"""
         print("\n📊 Creating sales forecasting model...")
@@ -277,19 +405,16 @@ class CoffeeSalesAdvancedAnalytics:
             insights['high_value_avg_price'] = high_value_customers['unit_price'].mean()
         
         # 4. Time-based sales patterns
-        time_sales = self.data.groupby('time_period')['total_amount'].mean().sort_values(ascending=False)
-        insights['peak_sales_time'] = time_sales.index[0]
-        insights['peak_sales_amount'] = time_sales.iloc[0]
+        time_sales = self.data.groupby('time_period')['total_amount'].mean()
+        insights['peak_sales_time'], insights['peak_sales_amount'] = top_one(time_sales)
         
         # 5. Product performance analysis
-        product_performance = self.data.groupby('product_category')['total_amount'].sum().sort_values(ascending=False)
-        insights['top_product_category'] = product_performance.index[0]
-        insights['top_category_sales'] = product_performance.iloc[0]
+        product_performance = self.data.groupby('product_category')['total_amount'].sum()
+        insights['top_product_category'], insights['top_category_sales'] = top_one(product_performance)
         
         # 6. Store performance analysis
-        store_performance = self.data.groupby('store_location')['total_amount'].sum().sort_values(ascending=False)
-        insights['top_store'] = store_performance.index[0]
-        insights['top_store_sales'] = store_performance.iloc[0]
+        store_performance = self.data.groupby('store_location')['total_amount'].sum()
+        insights['top_store'], insights['top_store_sales'] = top_one(store_performance)
         
         # 7. Weekend vs weekday analysis
         weekend_sales = self.data[self.data['is_weekend'] == 1]['total_amount'].mean()
@@ -321,26 +446,26 @@ class CoffeeSalesAdvancedAnalytics:
         print("\n🔮 Creating predictive insights...")
         
         # 1. Sales prediction by time period
-        time_predictions = self.data.groupby('time_period')['PredictedSales'].mean().sort_values(ascending=False)
+        time_predictions = self.data.groupby('time_period')['PredictedSales'].mean()
         
         # 2. Sales prediction by day of week
-        dow_predictions = self.data.groupby('day_of_week')['PredictedSales'].mean().sort_values(ascending=False)
+        dow_predictions = self.data.groupby('day_of_week')['PredictedSales'].mean()
         
         # 3. Sales prediction by product category
-        category_predictions = self.data.groupby('product_category')['PredictedSales'].mean().sort_values(ascending=False)
+        category_predictions = self.data.groupby('product_category')['PredictedSales'].mean()
         
         # 4. Sales prediction by store
-        store_predictions = self.data.groupby('store_location')['PredictedSales'].mean().sort_values(ascending=False)
+        store_predictions = self.data.groupby('store_location')['PredictedSales'].mean()
         
         # 5. Customer cluster predictions
-        cluster_predictions = self.data.groupby('CustomerCluster')['PredictedSales'].mean().sort_values(ascending=False)
+        cluster_predictions = self.data.groupby('CustomerCluster')['PredictedSales'].mean()
         
         insights = {
-            'best_time_period': time_predictions.index[0],
-            'best_day_of_week': dow_predictions.index[0],
-            'best_product_category': category_predictions.index[0],
-            'best_store': store_predictions.index[0],
-            'best_customer_cluster': cluster_predictions.index[0]
+            'best_time_period': top_one(time_predictions)[0],
+            'best_day_of_week': top_one(dow_predictions)[0],
+            'best_product_category': top_one(category_predictions)[0],
+            'best_store': top_one(store_predictions)[0],
+            'best_customer_cluster': top_one(cluster_predictions)[0]
         }
         
         print("Predictive Insights:")
@@ -390,11 +515,13 @@ class CoffeeSalesAdvancedAnalytics:
             f.write("- high_value_transactions.csv (High-value transactions)\n")
             f.write("- sales_feature_importance.png (Feature importance plot)\n")
             f.write("- customer_segments.png (Customer segmentation visualization)\n")
+            f.write("- product_pairs.csv (Top co-purchased products per product)\n")
         
         print("✅ Machine learning results exported!")
         print("📁 Files created:")
         print("  - sales_predictions.csv")
         print("  - customer_segments.csv")
+        print("  - product_pairs.csv")
         print("  - high_value_transactions.csv")
         print("  - coffee_sales_ml_report.txt")
     
@@ -403,6 +530,12 @@ class CoffeeSalesAdvancedAnalytics:
         print("🚀 Starting Coffee Sales Advanced Analytics Pipeline")
         print("=" * 50)
         
+        # Out-of-core mode never loads the full dataset into memory
+        if self.out_of_core:
+            self.train_out_of_core_models()
+            print("\n🎉 Out-of-core training completed successfully!")
+            return True
+        
         # Load data
         if not self.load_data():
             return False
@@ -410,6 +543,10 @@ class CoffeeSalesAdvancedAnalytics:
         # Prepare data for ML
         self.prepare_sales_prediction_data()
         
+        # Tune hyperparameters
+        if self.tune:
+            self.tune_hyperparameters()
+        
         # Train models
         self.train_sales_prediction_models()
         
@@ -419,6 +556,9 @@ class CoffeeSalesAdvancedAnalytics:
         # Customer segmentation
         self.customer_segmentation()
         
+        # Market basket analysis
+        self.market_basket_analysis()
+        
         # Sales forecasting
         self.sales_forecasting()
         
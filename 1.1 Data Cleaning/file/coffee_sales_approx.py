@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Approximate Queries
+================================
+
+Interactive approximate answers from a stratified sample of the processed
+sales data (store x category x month):
+- StratifiedSample: bottom-k sample per stratum, built chunk by chunk so the
+  full data never has to fit in memory, mergeable across shards
+- ApproximateQueryEngine: sums, means, shares and correlations with
+  confidence intervals, or exact answers on request
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import stats
+from coffee_sales_partitions import list_partitions
+
+STRATA = ['store_id', 'product_category', 'year', 'month']
+
+
+def iter_chunks(path, chunksize=200_000, columns=None):
+    """Yield DataFrame chunks from a CSV file or a partitioned dataset directory"""
+    if os.path.isdir(path):
+        for part in list_partitions(path)['path']:
+            if part.endswith('.parquet'):
+                yield pd.read_parquet(part, columns=columns)
+            else:
+                yield from pd.read_csv(part, usecols=columns, chunksize=chunksize)
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+class StratifiedSample:
+    """Keeps up to per_stratum rows per stratum with the smallest random priorities
+
+    Samples that will be merged must draw independent priorities: give every
+    shard its own `shard` number (or random_state=None for fresh entropy).
+    """
+
+    def __init__(self, strata=STRATA, per_stratum=500, random_state=42, shard=0):
+        self.strata = list(strata)
+        self.per_stratum = per_stratum
+        self.seed = None if random_state is None else (random_state, shard)
+        seed = None if random_state is None else np.random.SeedSequence(random_state, spawn_key=(shard,))
+        self.rng = np.random.default_rng(seed)
+        self.sample = None
+        self.population = None
+
+    def _add_population(self, counts):
+        if counts is None:
+            return
+        if self.population is None:
+            self.population = counts.astype('int64')
+        else:
+            self.population = self.population.add(counts, fill_value=0).astype('int64')
+
+    def update(self, chunk):
+        """Fold a chunk into the sample and the stratum population counts"""
+        chunk = chunk.assign(_priority=self.rng.random(len(chunk)))
+        self._add_population(chunk.groupby(self.strata, observed=True).size())
+
+        if self.sample is not None:
+            # Rows above a full stratum's current k-th priority can never enter the sample
+            thresholds = self.sample.groupby(self.strata, observed=True)['_priority'].max()
+            full = self.sample.groupby(self.strata, observed=True).size() >= self.per_stratum
+            thresholds = thresholds.where(full, 1.0)
+            keys = pd.MultiIndex.from_frame(chunk[self.strata])
+            limit = thresholds.reindex(keys).fillna(1.0).to_numpy()
+            chunk = pd.concat([self.sample, chunk[chunk['_priority'].to_numpy() <= limit]], ignore_index=True)
+
+        self.sample = self._trim(chunk)
+        return self
+
+    def _trim(self, frame):
+        """Keep the per_stratum rows with the smallest priorities in every stratum"""
+        return (frame.sort_values('_priority')
+                     .groupby(self.strata, observed=True, sort=False)
+                     .head(self.per_stratum)
+                     .reset_index(drop=True))
+
+    def merge(self, other):
+        """Merge a sample built on another shard of disjoint rows"""
+        if self.seed is not None and self.seed == other.seed:
+            raise ValueError(f"Both samples were built with seed {self.seed}; "
+                             "use a distinct shard (or random_state=None) per shard")
+        self._add_population(other.population)
+        samples = [sample for sample in (self.sample, other.sample) if sample is not None]
+        if samples:
+            # Priorities are i.i.d. uniform, so bottom-k of the union is a sample of the union
+            self.sample = self._trim(pd.concat(samples, ignore_index=True))
+        return self
+
+    @classmethod
+    def from_source(cls, path, chunksize=200_000, **kwargs):
+        """Build a sample by streaming a CSV file or partitioned dataset"""
+        sample = cls(**kwargs)
+        for chunk in iter_chunks(path, chunksize):
+            sample.update(chunk)
+        return sample
+
+    def weighted(self):
+        """Return the sample with stratum sizes and design weights N_h / n_h"""
+        sizes = self.sample.groupby(self.strata, observed=True)['_priority'].transform('size')
+        keys = pd.MultiIndex.from_frame(self.sample[self.strata])
+        population = self.population.reindex(keys).to_numpy()
+        return self.sample.assign(_n=sizes.to_numpy(), _N=population, _weight=population / sizes.to_numpy())
+
+    def save(self, path='coffee_sales_sample.pkl'):
+        # The generator state is saved so a reloaded sample continues its own priority stream
+        pd.to_pickle({'strata': self.strata, 'per_stratum': self.per_stratum, 'seed': self.seed,
+                      'rng_state': self.rng.bit_generator.state,
+                      'sample': self.sample, 'population': self.population}, path)
+
+    @classmethod
+    def load(cls, path='coffee_sales_sample.pkl'):
+        state = pd.read_pickle(path)
+        sample = cls(state['strata'], state['per_stratum'], random_state=None)
+        sample.seed = state['seed']
+        sample.rng.bit_generator.state = state['rng_state']
+        sample.sample = state['sample']
+        sample.population = state['population']
+        return sample
+
+
+class ApproximateQueryEngine:
+    """Answers aggregate questions from a StratifiedSample with confidence intervals"""
+
+    def __init__(self, sample, exact_source=None, confidence=0.95):
+        self.sample = sample
+        self.data = sample.weighted()
+        self.exact_source = exact_source
+        self.confidence = confidence
+        self.z = stats.norm.ppf(0.5 + confidence / 2)
+
+    def _mask(self, frame, where):
+        """Row filter from a DataFrame.eval expression or a callable returning a boolean Series"""
+        if where is None:
+            return np.ones(len(frame), dtype=bool)
+        if callable(where):
+            return np.asarray(where(frame), dtype=bool)
+        return frame.eval(where).to_numpy(dtype=bool)
+
+    def _variance(self, z):
+        """Stratified variance of a weighted total of z (with finite population correction)"""
+        data = self.data
+        s2 = pd.Series(z).groupby([data[col].to_numpy() for col in self.sample.strata]).var(ddof=1).fillna(0.0)
+        strata = data.drop_duplicates(self.sample.strata).set_index(self.sample.strata)
+        s2 = s2.reindex(strata.index).fillna(0.0).to_numpy()
+        n, N = strata['_n'].to_numpy(), strata['_N'].to_numpy()
+        return float(np.sum(N ** 2 * (1 - n / N) * s2 / n))
+
+    def _result(self, estimate, variance):
+        error = self.z * np.sqrt(max(variance, 0.0))
+        return {'estimate': estimate, 'ci_low': estimate - error, 'ci_high': estimate + error,
+                'std_error': float(np.sqrt(max(variance, 0.0))), 'confidence': self.confidence,
+                'sample_rows': len(self.data), 'exact': False}
+
+    def _ratio(self, numerator, denominator):
+        w = self.data['_weight'].to_numpy()
+        A, B = np.sum(w * numerator), np.sum(w * denominator)
+        if B == 0:
+            return self._result(np.nan, np.nan)
+        R = A / B
+        return self._result(R, self._variance((numerator - R * denominator) / B))
+
+    def _exact_frame(self):
+        """Full data from exact_source (a DataFrame or a callable returning one)"""
+        if self.exact_source is None:
+            raise ValueError("No exact_source configured for exact queries")
+        return self.exact_source() if callable(self.exact_source) else self.exact_source
+
+    def _exact(self, fn):
+        frame = self._exact_frame()
+        value = fn(frame)
+        return {'estimate': value, 'ci_low': value, 'ci_high': value, 'std_error': 0.0,
+                'confidence': 1.0, 'sample_rows': len(frame), 'exact': True}
+
+    def sum(self, column, where=None, exact=False):
+        """Total of a column over rows matching `where` (a DataFrame.eval expression)"""
+        if exact:
+            return self._exact(lambda df: float(df.loc[self._mask(df, where), column].sum()))
+        z = self.data[column].to_numpy(dtype=float) * self._mask(self.data, where)
+        estimate = float(np.sum(self.data['_weight'].to_numpy() * z))
+        return self._result(estimate, self._variance(z))
+
+    def count(self, where=None, exact=False):
+        if exact:
+            return self._exact(lambda df: int(self._mask(df, where).sum()))
+        z = self._mask(self.data, where).astype(float)
+        estimate = float(np.sum(self.data['_weight'].to_numpy() * z))
+        return self._result(estimate, self._variance(z))
+
+    def mean(self, column, where=None, exact=False):
+        if exact:
+            return self._exact(lambda df: float(df.loc[self._mask(df, where), column].mean()))
+        mask = self._mask(self.data, where).astype(float)
+        return self._ratio(self.data[column].to_numpy(dtype=float) * mask, mask)
+
+    def share(self, column, where, exact=False):
+        """Share (in %) of the column total contributed by rows matching `where`"""
+        if exact:
+            return self._exact(lambda df: float(df.loc[self._mask(df, where), column].sum() / df[column].sum() * 100))
+        values = self.data[column].to_numpy(dtype=float)
+        result = self._ratio(values * self._mask(self.data, where), values)
+        for key in ('estimate', 'ci_low', 'ci_high', 'std_error'):
+            result[key] *= 100
+        return result
+
+    def corr(self, x, y, where=None, exact=False):
+        """Pearson correlation with a Fisher-z interval on the effective sample size"""
+        if exact:
+            return self._exact(lambda df: float(df.loc[self._mask(df, where), x].corr(df.loc[self._mask(df, where), y])))
+        mask = self._mask(self.data, where)
+        w = self.data['_weight'].to_numpy()[mask]
+        a = self.data[x].to_numpy(dtype=float)[mask]
+        b = self.data[y].to_numpy(dtype=float)[mask]
+        ma, mb = np.average(a, weights=w), np.average(b, weights=w)
+        cov = np.average((a - ma) * (b - mb), weights=w)
+        r = float(cov / np.sqrt(np.average((a - ma) ** 2, weights=w) * np.average((b - mb) ** 2, weights=w)))
+
+        # Kish effective sample size accounts for unequal weights
+        n_eff = w.sum() ** 2 / np.sum(w ** 2)
+        error = self.z / np.sqrt(max(n_eff - 3, 1))
+        return {'estimate': r, 'ci_low': float(np.tanh(np.arctanh(r) - error)),
+                'ci_high': float(np.tanh(np.arctanh(r) + error)), 'std_error': float(1 / np.sqrt(max(n_eff - 3, 1))),
+                'confidence': self.confidence, 'sample_rows': int(mask.sum()), 'exact': False}
+
+    def group_sum(self, column, by, exact=False):
+        """Totals per group (e.g. by='store_location'), one row per group"""
+        if exact:
+            totals = self._exact_frame().groupby(by)[column].sum()
+            return pd.DataFrame({'estimate': totals, 'ci_low': totals, 'ci_high': totals, 'exact': True})
+        rows = {}
+        for group in self.data[by].dropna().unique():
+            rows[group] = self.sum(column, where=lambda df, group=group: df[by] == group)
+        return pd.DataFrame(rows).T
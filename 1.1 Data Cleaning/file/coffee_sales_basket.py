@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Market Basket Analysis
+===================================
+
+Product co-occurrence analysis over transaction baskets:
+- Rows are streamed in chunks split on basket boundaries (the last, possibly
+  incomplete basket of a chunk is carried into the next one)
+- Sparse CSR basket x product matrix per chunk built from integer codes
+- Co-occurrence counts from sparse matrix products
+- Support, confidence and lift for every product pair
+- Top partner products per product for the dashboard
+
+Memory is bounded by the chunk size and the (products x products)
+co-occurrence matrix, so millions of baskets over hundreds of SKUs are fine.
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from coffee_sales_ranking import top_k_per_group
+
+
+class MarketBasketAnalyzer:
+    """Accumulates product co-occurrence counts over baskets"""
+
+    def __init__(self, basket_col='transaction_id', item_col='product_id',
+                 label_col='product_detail', chunk_size=200_000):
+        self.basket_col = basket_col
+        self.item_col = item_col
+        self.label_col = label_col
+        self.chunk_size = chunk_size
+        self.items = []
+        self.item_labels = {}
+        self._item_codes = {}
+        self.co_occurrence = np.zeros((0, 0), dtype=np.int64)
+        self.n_baskets = 0
+        self._tail = None
+
+    def _codes_for(self, items):
+        """Map item ids to stable integer codes, growing the co-occurrence matrix for new items"""
+        new_items = [item for item in pd.unique(items) if item not in self._item_codes]
+        if new_items:
+            for item in new_items:
+                self._item_codes[item] = len(self.items)
+                self.items.append(item)
+            grown = np.zeros((len(self.items), len(self.items)), dtype=np.int64)
+            size = len(self.co_occurrence)
+            grown[:size, :size] = self.co_occurrence
+            self.co_occurrence = grown
+        return pd.Series(items).map(self._item_codes).to_numpy(dtype=np.int64)
+
+    def basket_matrix(self, chunk):
+        """Build a binary CSR basket x product matrix from a chunk of rows"""
+        basket_codes, baskets = pd.factorize(chunk[self.basket_col])
+        item_codes = self._codes_for(chunk[self.item_col].to_numpy())
+
+        matrix = sparse.csr_matrix(
+            (np.ones(len(chunk), dtype=np.int32), (basket_codes, item_codes)),
+            shape=(len(baskets), len(self.items))
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def partial_fit(self, chunk):
+        """Add a chunk of rows; the rows of one basket must be contiguous across chunks
+
+        The last basket of the chunk may continue in the next chunk, so it is
+        held back until then; call flush() after the final chunk.
+        """
+        if self._tail is not None:
+            chunk = pd.concat([self._tail, chunk], ignore_index=True)
+        if chunk.empty:
+            return self
+        baskets = chunk[self.basket_col].to_numpy()
+        other = np.flatnonzero(baskets != baskets[-1])
+        split = other[-1] + 1 if len(other) else 0
+        self._tail = chunk.iloc[split:]
+        return self._add(chunk.iloc[:split])
+
+    def flush(self):
+        """Count the basket held back from the last chunk"""
+        tail, self._tail = self._tail, None
+        if tail is not None:
+            self._add(tail)
+        return self
+
+    def _add(self, chunk):
+        """Count a chunk of complete baskets"""
+        if chunk.empty:
+            return self
+        if self.label_col in chunk.columns:
+            labels = chunk[[self.item_col, self.label_col]].drop_duplicates(self.item_col)
+            self.item_labels.update(zip(labels[self.item_col], labels[self.label_col]))
+
+        matrix = self.basket_matrix(chunk)
+        size = matrix.shape[1]
+
+        # X^T X over blocks of baskets keeps intermediate products small
+        for start in range(0, matrix.shape[0], self.chunk_size):
+            block = matrix[start:start + self.chunk_size]
+            self.co_occurrence[:size, :size] += (block.T @ block).toarray()
+
+        self.n_baskets += matrix.shape[0]
+        return self
+
+    def fit(self, data):
+        """Stream a DataFrame through partial_fit in chunk_size rows"""
+        if not data[self.basket_col].is_monotonic_increasing:
+            data = data.sort_values(self.basket_col, kind='stable')
+        for start in range(0, len(data), self.chunk_size):
+            self.partial_fit(data.iloc[start:start + self.chunk_size])
+        return self.flush()
+
+    def pair_table(self, min_count=1):
+        """Return support, confidence and lift for every ordered product pair"""
+        counts = self.co_occurrence
+        item_counts = np.diag(counts)
+
+        first, second = np.nonzero(counts >= min_count)
+        distinct = first != second
+        first, second = first[distinct], second[distinct]
+        pair_counts = counts[first, second]
+
+        support = pair_counts / self.n_baskets
+        confidence = pair_counts / item_counts[first]
+        lift = confidence / (item_counts[second] / self.n_baskets)
+
+        items = np.asarray(self.items, dtype=object)
+        table = pd.DataFrame({
+            'product': items[first],
+            'paired_product': items[second],
+            'pair_count': pair_counts,
+            'support': support,
+            'confidence': confidence,
+            'lift': lift
+        })
+        if self.item_labels:
+            table.insert(1, 'product_name', table['product'].map(self.item_labels))
+            table.insert(3, 'paired_product_name', table['paired_product'].map(self.item_labels))
+        return table
+
+    def top_pairs(self, k=5, metric='lift', min_count=5):
+        """Return the top k partner products per product ranked by `metric`
+
+        Pairs seen in fewer than min_count baskets are left out, so one-off
+        pairs do not top the ranking by lift.
+        """
+        table = self.pair_table(min_count=min_count)
+        if table.empty:
+            return table
+        group_codes = pd.factorize(table['product'])[0]
+        positions = top_k_per_group(group_codes, table[metric].to_numpy(), k)
+        return table.iloc[positions].reset_index(drop=True)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Batch Runner
+=========================
+
+Runs the preprocessing (and optionally advanced analytics) pipeline for many
+datasets, e.g. one per franchise region, on one shared bounded process pool:
+- Manifest (JSON list or CSV) of input datasets and output directories
+- Each dataset runs in its own worker process, in its own output directory,
+  with its own log file, so one failing dataset does not affect the others
+- Progress reporting and aggregate throughput statistics
+
+Manifest fields: name, input, output_dir, analytics (optional, default false),
+start_date / end_date / store_ids (optional filters).
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+
+def load_manifest(path):
+    """Read the manifest and resolve relative paths against its directory"""
+    if path.endswith('.json'):
+        with open(path) as f:
+            jobs = json.load(f)
+    else:
+        manifest = pd.read_csv(path, dtype=str)
+        jobs = manifest.astype(object).where(manifest.notna(), None).to_dict('records')
+
+    base = os.path.dirname(os.path.abspath(path))
+    for i, job in enumerate(jobs):
+        job.setdefault('name', f'dataset_{i + 1}')
+        job['input'] = os.path.normpath(os.path.join(base, job['input']))
+        job['output_dir'] = os.path.normpath(os.path.join(base, job['output_dir']))
+        job['analytics'] = str(job.get('analytics', False)).lower() in ('true', '1', 'yes')
+        # store_ids: a list in JSON, or 'id;id;...' in CSV
+        store_ids = job.get('store_ids')
+        if isinstance(store_ids, str):
+            job['store_ids'] = [int(store_id) for store_id in store_ids.split(';') if store_id.strip()]
+        elif store_ids is not None and not isinstance(store_ids, list):
+            job['store_ids'] = [int(store_ids)]
+    return jobs
+
+
+def run_dataset(job):
+    """Run the pipelines for one dataset inside its output directory (worker process)"""
+    # Headless plotting in workers; imported here so each worker starts clean
+    os.environ['MPLBACKEND'] = 'Agg'
+    from coffee_sales_preprocessing import CoffeeSalesPreprocessor
+    from coffee_sales_advanced_analytics import CoffeeSalesAdvancedAnalytics
+
+    result = {'name': job['name'], 'input': job['input'], 'output_dir': job['output_dir'],
+              'status': 'failed', 'rows': 0, 'seconds': 0.0, 'error': None}
+    started = time.perf_counter()
+    os.makedirs(job['output_dir'], exist_ok=True)
+    previous_dir = os.getcwd()
+
+    with open(os.path.join(job['output_dir'], 'pipeline.log'), 'w') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            # Every output file of the pipelines is written relative to the working directory
+            os.chdir(job['output_dir'])
+            preprocessor = CoffeeSalesPreprocessor()
+            ok = preprocessor.run_full_pipeline(job['input'], job.get('start_date'), job.get('end_date'),
+                                                job.get('store_ids'))
+            if ok and job['analytics']:
+                ok = CoffeeSalesAdvancedAnalytics().run_advanced_analytics()
+            if ok:
+                result['status'] = 'succeeded'
+                result['rows'] = len(preprocessor.transformed_df)
+            else:
+                result['error'] = 'pipeline returned False, see pipeline.log'
+        except Exception as e:
+            traceback.print_exc()
+            result['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            os.chdir(previous_dir)
+
+    result['seconds'] = round(time.perf_counter() - started, 2)
+    return result
+
+
+class BatchRunner:
+    """Schedules dataset pipelines on one shared, bounded process pool"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.results = []
+
+    def run(self, jobs):
+        """Run all jobs and return the per-dataset results"""
+        print(f"🚀 Running {len(jobs)} datasets on {self.max_workers} workers")
+        print("=" * 50)
+        started = time.perf_counter()
+        self.results = []
+
+        # One task per worker process keeps datasets isolated from each other
+        with ProcessPoolExecutor(max_workers=self.max_workers, max_tasks_per_child=1) as pool:
+            futures = {pool.submit(run_dataset, job): job for job in jobs}
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    result = {'name': job['name'], 'input': job['input'], 'output_dir': job['output_dir'],
+                              'status': 'failed', 'rows': 0, 'seconds': 0.0, 'error': f'{type(e).__name__}: {e}'}
+                self.results.append(result)
+                if result['status'] == 'succeeded':
+                    print(f"[{done}/{len(jobs)}] ✅ {result['name']}: {result['rows']} rows in {result['seconds']:.1f}s")
+                else:
+                    print(f"[{done}/{len(jobs)}] ❌ {result['name']}: {result['error']}")
+
+        self.wall_seconds = time.perf_counter() - started
+        return self.results
+
+    def stats(self):
+        """Aggregate throughput statistics for the last run"""
+        succeeded = [r for r in self.results if r['status'] == 'succeeded']
+        rows = sum(r['rows'] for r in succeeded)
+        busy = sum(r['seconds'] for r in self.results)
+        return {
+            'datasets': len(self.results),
+            'succeeded': len(succeeded),
+            'failed': len(self.results) - len(succeeded),
+            'rows': rows,
+            'wall_seconds': round(self.wall_seconds, 2),
+            'rows_per_second': round(rows / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            'datasets_per_minute': round(len(self.results) / self.wall_seconds * 60, 2) if self.wall_seconds else 0.0,
+            'worker_utilization': round(busy / (self.wall_seconds * self.max_workers), 3) if self.wall_seconds else 0.0
+        }
+
+    def write_summary(self, path='batch_run_summary.json'):
+        with open(path, 'w') as f:
+            json.dump({'stats': self.stats(), 'results': self.results}, f, indent=2)
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the coffee sales pipelines for many datasets')
+    parser.add_argument('manifest', help='JSON or CSV manifest of datasets')
+    parser.add_argument('--workers', type=int, default=None, help='Size of the shared process pool')
+    parser.add_argument('--summary', default='batch_run_summary.json', help='Where to write run statistics')
+    args = parser.parse_args()
+
+    runner = BatchRunner(max_workers=args.workers)
+    runner.run(load_manifest(args.manifest))
+    runner.write_summary(args.summary)
+
+    stats = runner.stats()
+    print("\n📊 Batch run summary:")
+    for key, value in stats.items():
+        print(f"  {key.replace('_', ' ').title()}: {value}")
+    print(f"Details saved to '{args.summary}'")
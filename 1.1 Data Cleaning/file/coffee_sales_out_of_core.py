@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Out-of-Core Training
+=================================
+
+Trains sales prediction models without holding the feature matrix in memory:
+- Streams the processed data in chunks and writes float32 feature batches
+  (.npy) plus a manifest to disk
+- Time-based holdout: the most recent part of the date range is the test set
+- StandardScaler and regressors are updated with partial_fit, one memory-mapped
+  batch at a time, so memory depends on the batch size, not the data size
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import SGDRegressor, PassiveAggressiveRegressor
+from sklearn.preprocessing import StandardScaler
+from coffee_sales_approx import iter_chunks
+
+MANIFEST = 'manifest.json'
+
+
+def write_feature_batches(source, feature_columns, out_dir='feature_batches', target='total_amount',
+                          date_col='transaction_date', batch_rows=100_000):
+    """Stream a CSV file / partitioned dataset into float32 feature batches on disk"""
+    os.makedirs(out_dir, exist_ok=True)
+    columns = list(dict.fromkeys(list(feature_columns) + [target, date_col]))
+    batches = []
+
+    for i, chunk in enumerate(iter_chunks(source, chunksize=batch_rows, columns=columns)):
+        chunk = chunk.dropna(subset=[target])
+        if chunk.empty:
+            continue
+        # Dates as days since epoch so the holdout split needs no parsing later
+        days = (pd.to_datetime(chunk[date_col], errors='coerce') - pd.Timestamp('1970-01-01')).dt.days
+        days = days.fillna(-1).to_numpy(dtype=np.int32)
+
+        name = f'batch_{i:05d}'
+        np.save(os.path.join(out_dir, f'{name}_X.npy'), chunk[list(feature_columns)].to_numpy(dtype=np.float32))
+        np.save(os.path.join(out_dir, f'{name}_y.npy'), chunk[target].to_numpy(dtype=np.float32))
+        np.save(os.path.join(out_dir, f'{name}_day.npy'), days)
+        valid = days[days >= 0]
+        batches.append({'name': name, 'rows': len(chunk),
+                        'min_day': int(valid.min()) if len(valid) else None,
+                        'max_day': int(valid.max()) if len(valid) else None})
+
+    manifest = {'features': list(feature_columns), 'target': target, 'batches': batches}
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class OutOfCoreTrainer:
+    """Incremental training over feature batches written by write_feature_batches"""
+
+    def __init__(self, batch_dir='feature_batches', models=None, epochs=3, holdout_fraction=0.2,
+                 random_state=42):
+        self.batch_dir = batch_dir
+        self.models = models or {
+            'SGD Regressor': SGDRegressor(random_state=random_state),
+            'Passive Aggressive Regressor': PassiveAggressiveRegressor(random_state=random_state)
+        }
+        self.epochs = epochs
+        self.holdout_fraction = holdout_fraction
+        self.rng = np.random.default_rng(random_state)
+        self.scaler = StandardScaler()
+        with open(os.path.join(batch_dir, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.cutoff_day = self._holdout_cutoff()
+
+    def _holdout_cutoff(self):
+        """First day of the test period: the last holdout_fraction of the date range"""
+        days = [(b['min_day'], b['max_day']) for b in self.manifest['batches'] if b['min_day'] is not None]
+        if not days:
+            raise ValueError("Feature batches contain no dated rows for a time-based holdout")
+        first, last = min(d[0] for d in days), max(d[1] for d in days)
+        return int(last - (last - first) * self.holdout_fraction)
+
+    def _batches(self, split, shuffle=False):
+        """Yield (X, y) for the train or test rows of each batch, memory-mapped"""
+        names = [b['name'] for b in self.manifest['batches']]
+        if shuffle:
+            names = list(self.rng.permutation(names))
+        for name in names:
+            path = os.path.join(self.batch_dir, name)
+            days = np.load(f'{path}_day.npy', mmap_mode='r')
+            mask = days >= self.cutoff_day if split == 'test' else (days < self.cutoff_day) & (days >= 0)
+            if not mask.any():
+                continue
+            X = np.load(f'{path}_X.npy', mmap_mode='r')[mask]
+            y = np.load(f'{path}_y.npy', mmap_mode='r')[mask]
+            yield X, y
+
+    def _transform(self, X):
+        # Missing values become the running mean (0 after scaling)
+        return np.nan_to_num(self.scaler.transform(X).astype(np.float32), nan=0.0)
+
+    def fit(self):
+        """Fit the streaming scaler, then run `epochs` passes of partial_fit"""
+        for X, _ in self._batches('train'):
+            self.scaler.partial_fit(X)
+
+        for epoch in range(self.epochs):
+            for X, y in self._batches('train', shuffle=True):
+                X_scaled = self._transform(X)
+                for model in self.models.values():
+                    model.partial_fit(X_scaled, y)
+        return self
+
+    def evaluate(self):
+        """Streaming test-set metrics per model, in the layout of train_sales_prediction_models"""
+        totals = {name: {'sse': 0.0, 'sae': 0.0} for name in self.models}
+        n, y_sum, y_sq = 0, 0.0, 0.0
+        for X, y in self._batches('test'):
+            X_scaled = self._transform(X)
+            y = y.astype(np.float64)
+            n += len(y)
+            y_sum += y.sum()
+            y_sq += np.square(y).sum()
+            for name, model in self.models.items():
+                error = y - model.predict(X_scaled)
+                totals[name]['sse'] += np.square(error).sum()
+                totals[name]['sae'] += np.abs(error).sum()
+
+        results = {}
+        sst = y_sq - y_sum ** 2 / n if n else 0.0
+        for name, model in self.models.items():
+            mse = totals[name]['sse'] / n if n else np.nan
+            results[name] = {
+                'model': model,
+                'mse': mse,
+                'rmse': np.sqrt(mse),
+                'mae': totals[name]['sae'] / n if n else np.nan,
+                'r2': 1 - totals[name]['sse'] / sst if sst else np.nan,
+                'test_rows': n
+            }
+        return results
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Partitioned Dataset
+================================
+
+Hive-style date-partitioned layout for the sales data:
+
+    root/year=2023/month=1/part-00000.csv
+    root/year=2023/month=1/store_id=5/part-00000.csv   (by_store=True)
+
+- Date-range and store filters prune partitions from the directory names
+  before any file is opened; partitions are read in (year, month, store) order
+- Writing only replaces the partitions present in the data, so rerunning
+  a single month rewrites just that month; rows of a partition outside the
+  filter a run was loaded with are kept
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import glob
+import os
+import shutil
+import pandas as pd
+
+DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+FILE_NAME = 'part-00000'
+STAGING_SUFFIX = '.staging'
+OLD_SUFFIX = '.old'
+
+
+def _partition_keys(df, date_col, by_store):
+    """Derive year/month (and store_id) partition keys for every row"""
+    dates = pd.to_datetime(df[date_col], errors='coerce')
+    keys = pd.DataFrame({
+        'year': dates.dt.year.astype('Int64').astype(str).replace('<NA>', DEFAULT_PARTITION),
+        'month': dates.dt.month.astype('Int64').astype(str).replace('<NA>', DEFAULT_PARTITION)
+    }, index=df.index)
+    if by_store:
+        keys['store_id'] = df['store_id'].astype(str)
+    return keys
+
+
+def _read_file(path, columns=None):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def write_partitioned(df, root, date_col='transaction_date', by_store=False, file_format='csv',
+                      start_date=None, end_date=None, store_ids=None):
+    """Write df under root, replacing only the partitions it contains; returns written paths
+
+    start_date / end_date / store_ids describe the filter df was loaded with:
+    existing rows of a partition outside that filter are kept, so a filtered
+    rerun only replaces the rows it actually covers.
+    """
+    filtered = start_date is not None or end_date is not None or store_ids is not None
+    keys = _partition_keys(df, date_col, by_store)
+    written = []
+    for values, rows in df.groupby([keys[col] for col in keys.columns], sort=True):
+        values = values if isinstance(values, tuple) else (values,)
+        directory = os.path.join(root, *[f'{col}={value}' for col, value in zip(keys.columns, values)])
+        staging, old = directory + STAGING_SUFFIX, directory + OLD_SUFFIX
+
+        # A run that died mid-swap leaves the only copy of the partition in .old
+        if os.path.exists(old):
+            if os.path.exists(directory):
+                shutil.rmtree(old)
+            else:
+                os.replace(old, directory)
+
+        if filtered:
+            for existing_path in glob.glob(os.path.join(directory, f'{FILE_NAME}.*')):
+                existing = _read_file(existing_path)
+                outside = ~_filter_mask(existing, start_date, end_date, store_ids, date_col)
+                rows = pd.concat([existing[outside.to_numpy()], rows], ignore_index=True)
+
+        # Build the new partition next to the old one, then swap it in; the old
+        # partition is only deleted once the new one is in place
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        path = os.path.join(staging, f'{FILE_NAME}.{file_format}')
+        if file_format == 'parquet':
+            rows.to_parquet(path, index=False)
+        else:
+            rows.to_csv(path, index=False)
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        os.replace(staging, directory)
+        shutil.rmtree(old, ignore_errors=True)
+        written.append(directory)
+    return written
+
+
+def _partition_order(value):
+    """Sort key: numeric partition values as integers, the default partition last"""
+    if isinstance(value, str) and value.isdigit():
+        return (0, int(value), '')
+    return (1, 0, str(value))
+
+
+def list_partitions(root):
+    """Return one row per data file with its partition values parsed from the path, in partition order"""
+    records = []
+    for path in glob.glob(os.path.join(root, '**', f'{FILE_NAME}.*'), recursive=True):
+        parts = os.path.relpath(os.path.dirname(path), root).split(os.sep)
+        # Skip leftovers of an interrupted write_partitioned, except an .old
+        # directory that is still the only copy of its partition
+        if any(part.endswith(STAGING_SUFFIX) for part in parts):
+            continue
+        if any(part.endswith(OLD_SUFFIX) for part in parts):
+            parts = [part[:-len(OLD_SUFFIX)] if part.endswith(OLD_SUFFIX) else part for part in parts]
+            if os.path.exists(os.path.join(root, *parts)):
+                continue
+        record = {'path': path}
+        for part in parts:
+            if '=' in part:
+                key, value = part.split('=', 1)
+                record[key] = value
+        records.append(record)
+
+    records.sort(key=lambda record: tuple(_partition_order(record.get(key))
+                                          for key in ('year', 'month', 'store_id')))
+    return pd.DataFrame(records, columns=['path', 'year', 'month', 'store_id'] if not records else None)
+
+
+def prune_partitions(partitions, start_date=None, end_date=None, store_ids=None):
+    """Keep only partitions that can contain rows in the date range / stores"""
+    if partitions.empty:
+        return partitions
+    keep = pd.Series(True, index=partitions.index)
+
+    if start_date is not None or end_date is not None:
+        known = (partitions['year'] != DEFAULT_PARTITION) & (partitions['month'] != DEFAULT_PARTITION)
+        month_start = pd.to_datetime(
+            partitions['year'].where(known, '1970') + '-' + partitions['month'].where(known, '1') + '-01'
+        )
+        month_end = month_start + pd.offsets.MonthEnd(0)
+        if start_date is not None:
+            keep &= month_end >= pd.Timestamp(start_date).normalize()
+        if end_date is not None:
+            keep &= month_start <= pd.Timestamp(end_date)
+        keep &= known
+
+    if store_ids is not None and 'store_id' in partitions.columns and partitions['store_id'].notna().any():
+        keep &= partitions['store_id'].isin([str(store_id) for store_id in store_ids])
+
+    return partitions[keep]
+
+
+def _filter_mask(df, start_date=None, end_date=None, store_ids=None, date_col='transaction_date'):
+    """Boolean Series of the rows matching the date-range / store filters"""
+    mask = pd.Series(True, index=df.index)
+    if start_date is not None or end_date is not None:
+        dates = pd.to_datetime(df[date_col], errors='coerce')
+        if start_date is not None:
+            mask &= dates >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= dates <= pd.Timestamp(end_date)
+    if store_ids is not None:
+        mask &= df['store_id'].isin(store_ids)
+    return mask
+
+
+def filter_rows(df, start_date=None, end_date=None, store_ids=None, date_col='transaction_date'):
+    """Apply the date-range / store filters at row level"""
+    if start_date is None and end_date is None and store_ids is None:
+        return df
+    return df[_filter_mask(df, start_date, end_date, store_ids, date_col)]
+
+
+def read_partitioned(root, start_date=None, end_date=None, store_ids=None, columns=None,
+                     date_col='transaction_date'):
+    """Read only the partitions matching the filters, then filter rows at the edges"""
+    partitions = prune_partitions(list_partitions(root), start_date, end_date, store_ids)
+
+    frames = [_read_file(path, columns) for path in partitions['path']]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.concat(frames, ignore_index=True)
+    return filter_rows(df, start_date, end_date, store_ids, date_col)
+
+
+# Main execution
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert a sales CSV into a year/month partitioned dataset')
+    parser.add_argument('source', help="Input CSV, e.g. 'Coffee Shop Sales.csv'")
+    parser.add_argument('root', help='Output dataset directory')
+    parser.add_argument('--by-store', action='store_true', help='Also partition by store_id')
+    args = parser.parse_args()
+
+    written = write_partitioned(pd.read_csv(args.source), args.root, by_store=args.by_store)
+    print(f"✅ Wrote {len(written)} partitions under {args.root}")
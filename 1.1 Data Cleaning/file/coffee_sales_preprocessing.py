@@ -15,31 +15,77 @@ Author: Data Analyst
 Date: 2024
 """
 
+import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 import warnings
+from coffee_sales_ranking import top_one, top_k, top_k_by_group, pareto, low_performers
+from coffee_sales_sketches import (HyperLogLog, GroupedDistinctCounter, precision_for_error,
+                                   error_for_precision, save_sketches, load_sketches)
+from coffee_sales_quality import DataQualityProfiler, write_quarantine
+from coffee_sales_partitions import read_partitioned, write_partitioned, filter_rows
+from coffee_sales_approx import StratifiedSample, ApproximateQueryEngine
 warnings.filterwarnings('ignore')
 
 # Set display options
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
 
+def iqr_bounds(values):
+    """Outlier bounds Q1 - 1.5 * IQR and Q3 + 1.5 * IQR"""
+    Q1, Q3 = np.nanquantile(np.asarray(values, dtype=float), [0.25, 0.75])
+    IQR = Q3 - Q1
+    return float(Q1 - 1.5 * IQR), float(Q3 + 1.5 * IQR)
+
+
 class CoffeeSalesPreprocessor:
-    def __init__(self):
+    def __init__(self, distinct_counts='exact', distinct_error=0.01,
+                 profile_path='data_quality_profile.csv', quarantine_path='coffee_sales_quarantine.csv',
+                 outlier_sample_size=100_000):
         self.sales_df = None
         self.cleaned_df = None
         self.transformed_df = None
         self.pivot_tables = {}
-        
-    def load_data(self):
-        """Load coffee sales CSV file"""
+        self.quality_profile = None
+        self.profiler = None
+        self.profile_path = profile_path
+        self.quarantine_path = quarantine_path
+        
+        # Fixed IQR bounds per column (from a full run or seeded); without them
+        # micro-batches use running quantiles over a bounded sample of past values
+        self.outlier_bounds = {}
+        self.outlier_sample_size = outlier_sample_size
+        self.outlier_samples = {}
+        self.outlier_seen = {}
+        self.rng = np.random.default_rng(42)
+        
+        # 'exact' uses nunique, 'approx' uses mergeable HyperLogLog sketches
+        if distinct_counts not in ('exact', 'approx'):
+            raise ValueError("distinct_counts must be 'exact' or 'approx'")
+        self.distinct_counts = distinct_counts
+        self.distinct_precision = precision_for_error(distinct_error)
+        achieved_error = error_for_precision(self.distinct_precision)
+        if distinct_counts == 'approx' and achieved_error > distinct_error:
+            print(f"⚠️ Requested distinct-count error {distinct_error:.4%} is below the sketch limit, "
+                  f"using {achieved_error:.4%}")
+        self.sketches = {}
+        
+    def load_data(self, path='Coffee Shop Sales.csv', start_date=None, end_date=None, store_ids=None):
+        """Load coffee sales data from a CSV file or a year/month partitioned dataset
+        
+        For a partitioned dataset directory, date-range and store filters prune
+        partitions before any file is read.
+        """
         print("Loading coffee sales data...")
         
         try:
-            self.sales_df = pd.read_csv('Coffee Shop Sales.csv')
+            if os.path.isdir(path):
+                self.sales_df = read_partitioned(path, start_date, end_date, store_ids)
+            else:
+                self.sales_df = filter_rows(pd.read_csv(path), start_date, end_date, store_ids)
             print("✅ Coffee sales data loaded successfully!")
             print(f"Total transactions: {len(self.sales_df)}")
             print(f"Date range: {self.sales_df['transaction_date'].min()} to {self.sales_df['transaction_date'].max()}")
@@ -50,8 +96,13 @@ class CoffeeSalesPreprocessor:
         
         return True
     
-    def clean_data(self):
-        """Clean and preprocess coffee sales data"""
+    def clean_data(self, incremental=False):
+        """Clean and preprocess coffee sales data
+        
+        With incremental=True (micro-batches) the quality profile keeps accumulating,
+        quarantined rows are appended and outliers are judged against the fixed
+        outlier_bounds if set, otherwise against running quantiles of all batches so far.
+        """
         print("\n🧹 Cleaning coffee sales data...")
         
         # Create a copy for cleaning
@@ -62,38 +113,38 @@ class CoffeeSalesPreprocessor:
         self.cleaned_df = self.cleaned_df.drop_duplicates()
         print(f"Removed {initial_count - len(self.cleaned_df)} duplicate records")
         
-        # Handle missing values
-        missing_before = self.cleaned_df.isnull().sum().sum()
-        
-        # Fill missing values with appropriate defaults
-        numeric_cols = self.cleaned_df.select_dtypes(include=[np.number]).columns
-        for col in numeric_cols:
-            if self.cleaned_df[col].isnull().sum() > 0:
-                self.cleaned_df[col].fillna(self.cleaned_df[col].median(), inplace=True)
-        
-        categorical_cols = self.cleaned_df.select_dtypes(include=['object']).columns
-        for col in categorical_cols:
-            if self.cleaned_df[col].isnull().sum() > 0:
-                self.cleaned_df[col].fillna(self.cleaned_df[col].mode()[0], inplace=True)
-        
-        missing_after = self.cleaned_df.isnull().sum().sum()
-        print(f"Handled {missing_before - missing_after} missing values")
-        
-        # Convert data types
-        self.cleaned_df['transaction_qty'] = pd.to_numeric(self.cleaned_df['transaction_qty'], errors='coerce')
-        self.cleaned_df['unit_price'] = pd.to_numeric(self.cleaned_df['unit_price'], errors='coerce')
-        
-        # Convert date columns
-        self.cleaned_df['transaction_date'] = pd.to_datetime(self.cleaned_df['transaction_date'], errors='coerce')
-        self.cleaned_df['transaction_time'] = pd.to_datetime(self.cleaned_df['transaction_time'], format='%H:%M:%S', errors='coerce')
+        # Profile all columns in one pass and convert data types; rows with
+        # unparseable numbers or dates are quarantined instead of becoming NaN/NaT
+        if self.profiler is None or not incremental:
+            self.profiler = DataQualityProfiler()
+        self.cleaned_df, rejected = self.profiler.update(self.cleaned_df)
+        self.quality_profile = self.profiler.report()
+        self.quality_profile.to_csv(self.profile_path)
+        write_quarantine(rejected, self.quarantine_path, append=incremental)
+        print(f"Quarantined {len(rejected)} rows with unparseable values")
+        
+        # Fill missing values: median for numeric columns, mode for the rest
+        null_counts = self.cleaned_df.isnull().sum()
+        missing_cols = null_counts[null_counts > 0].index
+        numeric_missing = self.cleaned_df[missing_cols].select_dtypes(include=[np.number]).columns
+        other_missing = missing_cols.difference(numeric_missing)
+        
+        fill_values = self.cleaned_df[numeric_missing].median().to_dict()
+        if len(other_missing) > 0:
+            fill_values.update(self.cleaned_df[other_missing].mode().iloc[0].dropna().to_dict())
+        
+        self.cleaned_df = self.cleaned_df.fillna(fill_values)
+        print(f"Handled {int(null_counts[list(fill_values)].sum())} missing values")
         
         # Handle outliers using IQR method
         for col in ['transaction_qty', 'unit_price']:
-            Q1 = self.cleaned_df[col].quantile(0.25)
-            Q3 = self.cleaned_df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
+            if incremental and col in self.outlier_bounds:
+                lower_bound, upper_bound = self.outlier_bounds[col]
+            elif incremental:
+                lower_bound, upper_bound = iqr_bounds(self._running_outlier_sample(col, self.cleaned_df[col]))
+            else:
+                lower_bound, upper_bound = iqr_bounds(self.cleaned_df[col])
+                self.outlier_bounds[col] = (lower_bound, upper_bound)
             
             outliers_before = ((self.cleaned_df[col] < lower_bound) | (self.cleaned_df[col] > upper_bound)).sum()
             self.cleaned_df = self.cleaned_df[(self.cleaned_df[col] >= lower_bound) & (self.cleaned_df[col] <= upper_bound)]
@@ -102,6 +153,25 @@ class CoffeeSalesPreprocessor:
         
         print("✅ Coffee sales data cleaned!")
     
+    def _running_outlier_sample(self, col, values):
+        """Add a batch to the column's reservoir sample of past values and return the sample"""
+        values = pd.to_numeric(values, errors='coerce').dropna().to_numpy(dtype=float)
+        sample = self.outlier_samples.get(col, np.empty(0))
+        seen = self.outlier_seen.get(col, 0)
+        
+        # Fill free slots first, then replace slot j with probability size / rows seen
+        free = max(self.outlier_sample_size - len(sample), 0)
+        sample = np.concatenate([sample, values[:free]])
+        rest = values[free:]
+        if len(rest):
+            slots = self.rng.integers(0, seen + free + np.arange(1, len(rest) + 1))
+            keep = slots < self.outlier_sample_size
+            sample[slots[keep]] = rest[keep]
+        
+        self.outlier_samples[col] = sample
+        self.outlier_seen[col] = seen + len(values)
+        return sample
+    
     def create_features(self):
         """Create new features for analysis"""
         print("\n🔧 Creating new features...")
@@ -169,6 +239,47 @@ class CoffeeSalesPreprocessor:
         
         print("✅ New features created!")
     
+    def count_distinct(self, column, by=None):
+        """Count distinct values of a column, overall or per group (exact or sketch-based)"""
+        if self.distinct_counts == 'exact':
+            if by is None:
+                return self.transformed_df[column].nunique()
+            return self.transformed_df.groupby(by)[column].nunique()
+        
+        # Counts are reported from a sketch of this run only, so they match the other
+        # columns of the summaries; the persisted (cumulative) sketch is merged separately
+        name = column if by is None else f'{column}_by_{by}'
+        cumulative = self.sketches.get(name)
+        precision = cumulative.precision if cumulative is not None else self.distinct_precision
+        
+        if by is None:
+            run_sketch = HyperLogLog(precision).update(self.transformed_df[column])
+            run_count = run_sketch.count()
+            if cumulative is None:
+                self.sketches[name] = HyperLogLog(precision)
+        else:
+            run_sketch = GroupedDistinctCounter(by, column, precision).update(self.transformed_df)
+            run_count = run_sketch.counts()
+            if cumulative is None:
+                self.sketches[name] = GroupedDistinctCounter(by, column, precision)
+        
+        self.sketches[name].merge(run_sketch)
+        return run_count
+    
+    def cumulative_distinct_count(self, column, by=None):
+        """Distinct count across all runs merged into the persisted sketches"""
+        name = column if by is None else f'{column}_by_{by}'
+        sketch = self.sketches[name]
+        return sketch.count() if by is None else sketch.counts()
+    
+    def save_distinct_sketches(self, path='distinct_count_sketches.npz'):
+        """Persist distinct-count sketches alongside the aggregated tables"""
+        save_sketches(path, self.sketches)
+    
+    def load_distinct_sketches(self, path='distinct_count_sketches.npz'):
+        """Load sketches from a previous run so this run's data is merged into them"""
+        self.sketches = load_sketches(path)
+    
     def create_aggregated_tables(self):
         """Create aggregated tables for Power BI"""
         print("\n📊 Creating aggregated tables...")
@@ -218,12 +329,12 @@ class CoffeeSalesPreprocessor:
             'transaction_id': 'count',
             'total_amount': ['sum', 'mean', 'min', 'max'],
             'transaction_qty': 'sum',
-            'unit_price': 'mean',
-            'product_id': 'nunique'
+            'unit_price': 'mean'
         }).round(2)
         
         store_summary.columns = ['TransactionCount', 'TotalSales', 'AvgSale', 'MinSale', 'MaxSale', 
-                               'TotalQuantity', 'AvgUnitPrice', 'UniqueProducts']
+                               'TotalQuantity', 'AvgUnitPrice']
+        store_summary['UniqueProducts'] = self.count_distinct('product_id', by='store_location')
         store_summary['AvgTransactionValue'] = (store_summary['TotalSales'] / store_summary['TransactionCount']).round(2)
         
         # Product category analysis
@@ -231,12 +342,12 @@ class CoffeeSalesPreprocessor:
             'transaction_id': 'count',
             'total_amount': ['sum', 'mean'],
             'transaction_qty': 'sum',
-            'unit_price': 'mean',
-            'product_id': 'nunique'
+            'unit_price': 'mean'
         }).round(2)
         
         category_summary.columns = ['TransactionCount', 'TotalSales', 'AvgSale', 'TotalQuantity', 
-                                  'AvgUnitPrice', 'UniqueProducts']
+                                  'AvgUnitPrice']
+        category_summary['UniqueProducts'] = self.count_distinct('product_id', by='product_category')
         category_summary['CategoryShare'] = (category_summary['TotalSales'] / category_summary['TotalSales'].sum() * 100).round(2)
         
         # Time period analysis
@@ -273,6 +384,58 @@ class CoffeeSalesPreprocessor:
         
         return store_summary, category_summary, time_summary, daily_trends
     
+    def create_ranking_tables(self, top_n=10):
+        """Create ranking tables (top products, Pareto, low performers, best/worst days)"""
+        print("\n🏆 Creating ranking tables...")
+        
+        rankings = {}
+        product_sales = self.transformed_df.groupby('product_detail')['total_amount'].sum()
+        
+        # Top N products overall
+        rankings['top_products'] = top_k(product_sales, top_n).rename('TotalSales').to_frame()
+        
+        # Top 5 products each month
+        month_product_sales = self.transformed_df.groupby(['month', 'product_detail'])['total_amount'].sum()
+        rankings['top_products_by_month'] = top_k_by_group(month_product_sales, 5).rename('TotalSales').to_frame()
+        
+        # Best-selling product per store
+        store_product_sales = self.transformed_df.groupby(['store_location', 'product_detail'])['total_amount'].sum()
+        rankings['best_product_by_store'] = top_k_by_group(store_product_sales, 1).rename('TotalSales').to_frame()
+        
+        # Pareto 80/20 by category and low performers under 5%
+        category_sales = self.transformed_df.groupby('product_category')['total_amount'].sum()
+        rankings['category_pareto'] = pareto(category_sales, threshold=0.8)
+        rankings['low_performing_products'] = low_performers(product_sales, max_share=0.05)
+        
+        # Best and worst days
+        daily_sales = self.transformed_df.groupby('transaction_date')['total_amount'].sum()
+        best_days = top_k(daily_sales, top_n).rename('TotalSales').to_frame()
+        best_days['Rank'] = 'Best'
+        worst_days = top_k(daily_sales, top_n, ascending=True).rename('TotalSales').to_frame()
+        worst_days['Rank'] = 'Worst'
+        rankings['best_worst_days'] = pd.concat([best_days, worst_days])
+        
+        for name, table in rankings.items():
+            table.to_csv(f'{name}.csv')
+        
+        print("✅ Ranking tables created and saved!")
+        return rankings
+    
+    def create_query_sample(self, per_stratum=500, path='coffee_sales_sample.pkl'):
+        """Build a store x category x month stratified sample for approximate queries
+        
+        The returned engine answers sums, means, shares and correlations from the
+        sample with confidence intervals, and falls back to transformed_df with exact=True.
+        """
+        print("\n🎲 Creating stratified sample for approximate queries...")
+        
+        sample = StratifiedSample(per_stratum=per_stratum).update(self.transformed_df)
+        sample.save(path)
+        engine = ApproximateQueryEngine(sample, exact_source=lambda: self.transformed_df)
+        
+        print(f"✅ Sample of {len(sample.sample)} rows across {len(sample.population)} strata saved to {path}")
+        return engine
+    
     def generate_insights(self):
         """Generate key insights and statistics"""
         print("\n📈 Generating insights...")
@@ -284,8 +447,8 @@ class CoffeeSalesPreprocessor:
         insights['total_sales'] = self.transformed_df['total_amount'].sum()
         insights['avg_transaction_value'] = self.transformed_df['total_amount'].mean()
         insights['total_quantity_sold'] = self.transformed_df['transaction_qty'].sum()
-        insights['unique_products'] = self.transformed_df['product_id'].nunique()
-        insights['unique_stores'] = self.transformed_df['store_id'].nunique()
+        insights['unique_products'] = self.count_distinct('product_id')
+        insights['unique_stores'] = self.count_distinct('store_id')
         
         # Date range
         insights['date_range_days'] = (self.transformed_df['transaction_date'].max() - self.transformed_df['transaction_date'].min()).days
@@ -293,20 +456,17 @@ class CoffeeSalesPreprocessor:
         insights['avg_daily_sales'] = insights['total_sales'] / insights['date_range_days']
         
         # Top performing categories
-        category_sales = self.transformed_df.groupby('product_category')['total_amount'].sum().sort_values(ascending=False)
-        insights['top_category'] = category_sales.index[0]
-        insights['top_category_sales'] = category_sales.iloc[0]
-        insights['top_category_share'] = (category_sales.iloc[0] / insights['total_sales'] * 100)
+        category_sales = self.transformed_df.groupby('product_category')['total_amount'].sum()
+        insights['top_category'], insights['top_category_sales'] = top_one(category_sales)
+        insights['top_category_share'] = (insights['top_category_sales'] / insights['total_sales'] * 100)
         
         # Top performing stores
-        store_sales = self.transformed_df.groupby('store_location')['total_amount'].sum().sort_values(ascending=False)
-        insights['top_store'] = store_sales.index[0]
-        insights['top_store_sales'] = store_sales.iloc[0]
+        store_sales = self.transformed_df.groupby('store_location')['total_amount'].sum()
+        insights['top_store'], insights['top_store_sales'] = top_one(store_sales)
         
         # Time insights
-        time_sales = self.transformed_df.groupby('time_period')['total_amount'].sum().sort_values(ascending=False)
-        insights['peak_time'] = time_sales.index[0]
-        insights['peak_time_sales'] = time_sales.iloc[0]
+        time_sales = self.transformed_df.groupby('time_period')['total_amount'].sum()
+        insights['peak_time'], insights['peak_time_sales'] = top_one(time_sales)
         
         # Weekend vs weekday
         weekend_sales = self.transformed_df[self.transformed_df['is_weekend'] == 1]['total_amount'].sum()
@@ -377,6 +537,10 @@ class CoffeeSalesPreprocessor:
         # Export individual cleaned datasets
         self.cleaned_df.to_csv('coffee_sales_cleaned.csv', index=False)
         
+        # Persist distinct-count sketches so later runs can merge into them
+        if self.distinct_counts == 'approx':
+            self.save_distinct_sketches()
+        
         # Create a summary report
         with open('coffee_sales_processing_report.txt', 'w') as f:
             f.write("Coffee Sales Data Processing Report\n")
@@ -389,6 +553,8 @@ class CoffeeSalesPreprocessor:
             f.write("Files Created:\n")
             f.write("- coffee_sales_processed.csv (Main dataset for Power BI)\n")
             f.write("- coffee_sales_cleaned.csv (Cleaned sales data)\n")
+            f.write("- data_quality_profile.csv (Nulls, coercion failures, ranges and top values per column)\n")
+            f.write("- coffee_sales_quarantine.csv (Rows rejected for unparseable values)\n")
             f.write("- store_summary.csv (Store performance analysis)\n")
             f.write("- category_summary.csv (Product category analysis)\n")
             f.write("- time_summary.csv (Time period analysis)\n")
@@ -397,6 +563,11 @@ class CoffeeSalesPreprocessor:
             f.write("- sales_by_store_dow.csv (Store-day pivot)\n")
             f.write("- product_performance.csv (Product performance matrix)\n")
             f.write("- time_sales_analysis.csv (Time-based analysis)\n")
+            f.write("- top_products.csv, top_products_by_month.csv, best_product_by_store.csv (Product rankings)\n")
+            f.write("- category_pareto.csv, low_performing_products.csv (Pareto and low performers)\n")
+            f.write("- best_worst_days.csv (Best and worst sales days)\n")
+            if self.distinct_counts == 'approx':
+                f.write("- distinct_count_sketches.npz (HyperLogLog distinct-count state)\n")
         
         print("✅ Data exported for Power BI!")
         print("📁 Files created:")
@@ -405,13 +576,28 @@ class CoffeeSalesPreprocessor:
         print("  - Various summary tables and pivot tables")
         print("  - coffee_sales_processing_report.txt")
     
-    def run_full_pipeline(self):
+    def export_partitioned_dataset(self, root='coffee_sales_dataset', by_store=False,
+                                   start_date=None, end_date=None, store_ids=None):
+        """Write the processed data as a year/month (optionally store) partitioned dataset
+        
+        Only partitions present in the processed data are replaced, so a run
+        restricted to one month rewrites just that month. Pass the filter the
+        data was loaded with so rows outside it are kept in those partitions.
+        """
+        print(f"\n🗂️ Writing partitioned dataset to {root}...")
+        written = write_partitioned(self.transformed_df, root, by_store=by_store,
+                                    start_date=start_date, end_date=end_date, store_ids=store_ids)
+        print(f"✅ {len(written)} partitions written!")
+        return written
+    
+    def run_full_pipeline(self, input_path='Coffee Shop Sales.csv', start_date=None, end_date=None,
+                          store_ids=None, partitioned_output=None, partition_by_store=False):
         """Run the complete data processing pipeline"""
         print("🚀 Starting Coffee Sales Data Processing Pipeline")
         print("=" * 50)
         
         # Load data
-        if not self.load_data():
+        if not self.load_data(input_path, start_date, end_date, store_ids):
             return False
         
         # Clean data
@@ -423,6 +609,9 @@ class CoffeeSalesPreprocessor:
         # Create aggregated tables
         self.create_aggregated_tables()
         
+        # Create ranking tables
+        self.create_ranking_tables()
+        
         # Generate insights
         self.generate_insights()
         
@@ -432,6 +621,11 @@ class CoffeeSalesPreprocessor:
         # Export for Power BI
         self.export_for_powerbi()
         
+        # Export partitioned dataset
+        if partitioned_output:
+            self.export_partitioned_dataset(partitioned_output, by_store=partition_by_store,
+                                            start_date=start_date, end_date=end_date, store_ids=store_ids)
+        
         print("\n🎉 Pipeline completed successfully!")
         return True
 
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Data Quality Profiler
+==================================
+
+Profiles every column of the raw sales data in one vectorized pass:
+- Null counts per column
+- Type coercion failures (numbers and dates that cannot be parsed)
+- Value ranges for numeric and date columns
+- Top values for categorical columns
+
+Profiles are chunk-mergeable, rows that fail coercion are returned for
+the quarantine file instead of silently becoming NaN/NaT.
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+NUMERIC_COLUMNS = ['transaction_qty', 'unit_price']
+DATE_COLUMNS = {'transaction_date': None, 'transaction_time': '%H:%M:%S'}
+
+
+class DataQualityProfiler:
+    """Accumulates a data-quality profile over one or more chunks"""
+
+    def __init__(self, numeric_columns=NUMERIC_COLUMNS, date_columns=DATE_COLUMNS, top_n=5):
+        self.numeric_columns = list(numeric_columns)
+        self.date_columns = dict(date_columns)
+        self.top_n = top_n
+        self.row_count = 0
+        self.rejected_count = 0
+        self.dtypes = {}
+        self.null_counts = pd.Series(dtype='int64')
+        self.coercion_failures = pd.Series(dtype='int64')
+        self.minimums = {}
+        self.maximums = {}
+        self.value_counts = {}
+
+    def coerce(self, chunk):
+        """Return (typed chunk, boolean frame of coercion failures)"""
+        typed = chunk.copy()
+        converted = {}
+        for col in self.numeric_columns:
+            if col in chunk.columns:
+                converted[col] = pd.to_numeric(chunk[col], errors='coerce')
+        for col, fmt in self.date_columns.items():
+            if col in chunk.columns:
+                converted[col] = pd.to_datetime(chunk[col], format=fmt, errors='coerce')
+
+        if not converted:
+            return typed, pd.DataFrame(index=chunk.index)
+
+        converted = pd.DataFrame(converted, index=chunk.index)
+        typed[converted.columns] = converted
+
+        # A failure is a value that was present but could not be parsed
+        failures = converted.isna() & chunk[converted.columns].notna()
+        return typed, failures
+
+    def update(self, chunk):
+        """Profile a chunk; return (typed accepted rows, rejected raw rows)"""
+        typed, failures = self.coerce(chunk)
+        rejected_mask = failures.any(axis=1).to_numpy() if len(failures.columns) else np.zeros(len(chunk), bool)
+
+        self.row_count += len(chunk)
+        self.rejected_count += int(rejected_mask.sum())
+        for col, dtype in typed.dtypes.items():
+            self.dtypes.setdefault(col, str(dtype))
+
+        # Null counts over the raw frame in one pass
+        self.null_counts = self.null_counts.add(chunk.isna().sum(), fill_value=0).astype('int64')
+        self.coercion_failures = self.coercion_failures.add(failures.sum(), fill_value=0).astype('int64')
+
+        # Ranges over all numeric and date columns at once
+        ranged = typed.select_dtypes(include=[np.number, 'datetime'])
+        if not ranged.empty:
+            for col, value in ranged.min().items():
+                self.minimums[col] = _combine(self.minimums.get(col), value, min)
+            for col, value in ranged.max().items():
+                self.maximums[col] = _combine(self.maximums.get(col), value, max)
+
+        # Top values for categorical columns (typed date/number columns excluded)
+        for col in typed.select_dtypes(include=['object', 'category']).columns:
+            counts = typed[col].value_counts()
+            previous = self.value_counts.get(col)
+            self.value_counts[col] = counts if previous is None else previous.add(counts, fill_value=0)
+
+        # Always add the reason column so appended quarantine files keep one layout
+        rejected = chunk[rejected_mask].copy()
+        failed = failures[rejected_mask]
+        reasons = ['unparseable ' + ', '.join(failed.columns[row]) for row in failed.to_numpy(dtype=bool)]
+        rejected['rejection_reason'] = pd.Series(reasons, index=rejected.index, dtype=object)
+        return typed[~rejected_mask], rejected
+
+    def merge(self, other):
+        """Merge a profile built on another chunk or shard"""
+        self.row_count += other.row_count
+        self.rejected_count += other.rejected_count
+        for col, dtype in other.dtypes.items():
+            self.dtypes.setdefault(col, dtype)
+        self.null_counts = self.null_counts.add(other.null_counts, fill_value=0).astype('int64')
+        self.coercion_failures = self.coercion_failures.add(other.coercion_failures, fill_value=0).astype('int64')
+        for col, value in other.minimums.items():
+            self.minimums[col] = _combine(self.minimums.get(col), value, min)
+        for col, value in other.maximums.items():
+            self.maximums[col] = _combine(self.maximums.get(col), value, max)
+        for col, counts in other.value_counts.items():
+            previous = self.value_counts.get(col)
+            self.value_counts[col] = counts if previous is None else previous.add(counts, fill_value=0)
+        return self
+
+    def report(self):
+        """Return the profile as one row per column"""
+        columns = list(self.dtypes)
+        report = pd.DataFrame(index=pd.Index(columns, name='column'))
+        report['dtype'] = pd.Series(self.dtypes)
+        report['rows'] = self.row_count
+        report['nulls'] = self.null_counts.reindex(columns, fill_value=0).astype('int64')
+        report['null_pct'] = (report['nulls'] / max(self.row_count, 1) * 100).round(2)
+        report['coercion_failures'] = self.coercion_failures.reindex(columns, fill_value=0).astype('int64')
+        report['min'] = pd.Series(self.minimums, dtype=object)
+        report['max'] = pd.Series(self.maximums, dtype=object)
+        report['top_values'] = pd.Series({
+            col: '; '.join(f'{value} ({int(count)})' for value, count in counts.nlargest(self.top_n).items())
+            for col, counts in self.value_counts.items()
+        }, dtype=object)
+        return report
+
+
+def _combine(current, value, pick):
+    """Combine running min/max values, ignoring missing ones"""
+    if current is None or pd.isna(current):
+        return value
+    if pd.isna(value):
+        return current
+    return pick(current, value)
+
+
+def write_quarantine(rejected, path, append=False):
+    """Write rejected rows to the quarantine file"""
+    header = not (append and os.path.exists(path))
+    rejected.to_csv(path, mode='a' if append else 'w', header=header, index=False)
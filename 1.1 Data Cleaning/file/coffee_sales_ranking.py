@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Ranking Engine
+===========================
+
+Top-K / Pareto helpers for the ranking questions in the dashboard:
+- Top N products, top N products per month / per store
+- Pareto (80/20) contributors and low performers
+- Best / worst days
+
+Rankings are computed over aggregated arrays with partial selection
+(numpy argpartition) so only the K winners are ever sorted. The
+RankingAccumulator keeps running totals so rankings can be updated
+chunk by chunk while streaming.
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def top_k_indices(values, k, ascending=False):
+    """Return positions of the k largest (or smallest) values, best first"""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Rank on the sign-flipped array so the selection is always "smallest first"
+    keys = values if ascending else -values
+    keys = np.where(np.isnan(keys), np.inf, keys)
+
+    if k < n:
+        candidates = np.argpartition(keys, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+
+    # Only the k winners are sorted
+    return candidates[np.argsort(keys[candidates], kind='stable')]
+
+
+def top_k(series, k, ascending=False):
+    """Return the top k entries of an aggregated Series, best first"""
+    return series.iloc[top_k_indices(series.to_numpy(), k, ascending=ascending)]
+
+
+def top_one(series, ascending=False):
+    """Return (label, value) of the best entry of an aggregated Series"""
+    best = top_k(series, 1, ascending=ascending)
+    return best.index[0], best.iloc[0]
+
+
+def top_k_per_group(group_codes, values, k, ascending=False):
+    """Return positions of the top k values within each group, grouped and best first"""
+    group_codes = np.asarray(group_codes)
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Group boundaries from a single stable argsort of the (small) group codes
+    order = np.argsort(group_codes, kind='stable')
+    boundaries = np.flatnonzero(np.diff(group_codes[order])) + 1
+
+    selected = []
+    for positions in np.split(order, boundaries):
+        selected.append(positions[top_k_indices(values[positions], k, ascending=ascending)])
+
+    return np.concatenate(selected)
+
+
+def top_k_by_group(series, k, ascending=False):
+    """Return the top k items for each level-0 group of a two-level aggregated Series"""
+    group_codes = pd.factorize(series.index.get_level_values(0))[0]
+    return series.iloc[top_k_per_group(group_codes, series.to_numpy(), k, ascending=ascending)]
+
+
+def pareto(series, threshold=0.8):
+    """Return the smallest set of entries that together make up `threshold` of the total"""
+    series = series[series > 0]
+    total = series.sum()
+    if total <= 0:
+        return series.iloc[:0]
+
+    values = series.to_numpy(dtype=float)
+    target = threshold * total
+
+    # Grow the candidate set until it covers the target, then sort only that set
+    k = 1
+    while True:
+        positions = top_k_indices(values, k)
+        if values[positions].sum() >= target or k >= len(values):
+            break
+        k = min(k * 2, len(values))
+
+    cumulative = np.cumsum(values[positions])
+    cutoff = int(np.searchsorted(cumulative, target)) + 1
+    result = series.iloc[positions[:cutoff]].to_frame('value')
+    result['share'] = (result['value'] / total * 100).round(2)
+    result['cumulative_share'] = (cumulative[:cutoff] / total * 100).round(2)
+    return result
+
+
+def low_performers(series, max_share=0.05):
+    """Return entries contributing less than `max_share` of the total, worst first"""
+    total = series.sum()
+    shares = series / total if total else series * 0
+    low = shares[shares < max_share]
+    ranked = top_k(low, len(low), ascending=True)
+    return pd.DataFrame({'value': series[ranked.index], 'share': (ranked * 100).round(2)})
+
+
+class RankingAccumulator:
+    """Running totals of value_col by (group_col, item_col) that can be ranked at any time"""
+
+    def __init__(self, item_col, value_col, group_col=None):
+        self.item_col = item_col
+        self.value_col = value_col
+        self.group_col = group_col
+        self.totals = None
+
+    def update(self, chunk):
+        """Fold a chunk of transactions into the running totals"""
+        keys = [self.group_col, self.item_col] if self.group_col else [self.item_col]
+        partial = chunk.groupby(keys, observed=True)[self.value_col].sum()
+        self._add(partial)
+        return self
+
+    def merge(self, other):
+        """Merge the totals of another accumulator built on a different chunk or shard"""
+        if other.totals is not None:
+            self._add(other.totals)
+        return self
+
+    def _add(self, partial):
+        if self.totals is None:
+            self.totals = partial.astype(float)
+        else:
+            self.totals = self.totals.add(partial, fill_value=0)
+
+    def top(self, k, ascending=False):
+        """Return the current top k items (per group when a group column is set)"""
+        if self.totals is None:
+            return pd.Series(dtype=float)
+        if self.group_col:
+            return top_k_by_group(self.totals, k, ascending=ascending)
+        return top_k(self.totals, k, ascending=ascending)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Distinct-Count Sketches
+====================================
+
+HyperLogLog sketches for approximate distinct counts (unique products,
+unique stores, ...) with bounded memory and a configurable error:
+- HyperLogLog: one distinct count
+- GroupedDistinctCounter: one distinct count per group (e.g. per store)
+
+Sketches are mergeable across chunks, shards and incremental runs
+(register-wise max) and can be saved next to the aggregated tables.
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import json
+import math
+import numpy as np
+import pandas as pd
+
+MIN_PRECISION = 11
+MAX_PRECISION = 18
+
+
+def precision_for_error(relative_error):
+    """Return the HyperLogLog precision giving roughly the requested relative error"""
+    if not 0 < relative_error < 1:
+        raise ValueError("relative_error must be between 0 and 1 (exclusive)")
+    precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return int(min(max(precision, MIN_PRECISION), MAX_PRECISION))
+
+
+def error_for_precision(precision):
+    """Return the standard relative error of a HyperLogLog sketch with this precision"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def _register_updates(values, precision):
+    """Hash values and return (register index, rank) pairs"""
+    hashes = pd.util.hash_array(np.asarray(values))
+    tail_bits = 64 - precision
+    index = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+    tail = hashes & np.uint64((1 << tail_bits) - 1)
+
+    # tail < 2**53 for the supported precisions, so frexp gives the exact bit length
+    bit_length = np.frexp(tail.astype(np.float64))[1]
+    rank = (tail_bits - bit_length + 1).astype(np.uint8)
+    return index, rank
+
+
+def _estimate(registers):
+    """HyperLogLog estimate with linear counting for small cardinalities"""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class HyperLogLog:
+    """Approximate distinct counter"""
+
+    def __init__(self, precision=14):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @classmethod
+    def from_error(cls, relative_error):
+        return cls(precision_for_error(relative_error))
+
+    @property
+    def relative_error(self):
+        return error_for_precision(self.precision)
+
+    def update(self, values):
+        """Add an array of values to the sketch"""
+        index, rank = _register_updates(pd.Series(values).dropna().to_numpy(), self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        """Merge a sketch built on another chunk or shard"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        return int(round(float(_estimate(self.registers))))
+
+    def to_state(self):
+        return {'kind': np.array('hll'), 'precision': np.array(self.precision), 'registers': self.registers}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(int(state['precision']))
+        sketch.registers = np.asarray(state['registers'], dtype=np.uint8).copy()
+        return sketch
+
+
+class GroupedDistinctCounter:
+    """Approximate distinct counts of value_col per key_col"""
+
+    def __init__(self, key_col, value_col, precision=14):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
+        self.key_col = key_col
+        self.value_col = value_col
+        self.precision = precision
+        self.labels = []
+        self._positions = {}
+        self.registers = np.zeros((0, 1 << precision), dtype=np.uint8)
+
+    def _rows_for(self, keys):
+        """Map group labels to register rows, growing the register matrix for new groups"""
+        uniques = pd.unique(keys)
+        new_labels = [label for label in uniques if label not in self._positions]
+        if new_labels:
+            for label in new_labels:
+                self._positions[label] = len(self.labels)
+                self.labels.append(label)
+            grown = np.zeros((len(self.labels), self.registers.shape[1]), dtype=np.uint8)
+            grown[:len(self.registers)] = self.registers
+            self.registers = grown
+        return pd.Series(keys).map(self._positions).to_numpy(dtype=np.int64)
+
+    def update(self, chunk):
+        """Fold a chunk of rows into the per-group sketches"""
+        chunk = chunk[[self.key_col, self.value_col]].dropna()
+        if chunk.empty:
+            return self
+        rows = self._rows_for(chunk[self.key_col].to_numpy())
+        index, rank = _register_updates(chunk[self.value_col].to_numpy(), self.precision)
+
+        # Reduce to one max per (group, register) before touching the matrix
+        flat = rows * self.registers.shape[1] + index
+        best = pd.Series(rank).groupby(flat).max()
+        cells = best.index.to_numpy()
+        registers = self.registers.reshape(-1)
+        registers[cells] = np.maximum(registers[cells], best.to_numpy(dtype=np.uint8))
+        return self
+
+    def merge(self, other):
+        """Merge per-group sketches built on another chunk or shard"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        if not other.labels:
+            return self
+        rows = self._rows_for(np.asarray(other.labels, dtype=object))
+        self.registers[rows] = np.maximum(self.registers[rows], other.registers)
+        return self
+
+    def counts(self):
+        """Return the estimated distinct count per group"""
+        estimates = np.rint(_estimate(self.registers)).astype(np.int64) if self.labels else []
+        return pd.Series(estimates, index=pd.Index(self.labels, name=self.key_col), name=self.value_col)
+
+    def to_state(self):
+        return {
+            'kind': np.array('grouped'),
+            'precision': np.array(self.precision),
+            'columns': np.array(json.dumps([self.key_col, self.value_col])),
+            'labels': np.array(json.dumps([_to_json(label) for label in self.labels])),
+            'registers': self.registers,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        key_col, value_col = json.loads(str(state['columns']))
+        counter = cls(key_col, value_col, int(state['precision']))
+        counter.labels = json.loads(str(state['labels']))
+        counter._positions = {label: i for i, label in enumerate(counter.labels)}
+        counter.registers = np.asarray(state['registers'], dtype=np.uint8).copy()
+        return counter
+
+
+def _to_json(label):
+    """Convert numpy scalars to plain Python values for JSON"""
+    return label.item() if isinstance(label, np.generic) else label
+
+
+def save_sketches(path, sketches):
+    """Save a dict of named sketches to a single .npz file"""
+    arrays = {}
+    for name, sketch in sketches.items():
+        for field, value in sketch.to_state().items():
+            arrays[f'{name}__{field}'] = value
+    np.savez_compressed(path, **arrays)
+
+
+def load_sketches(path):
+    """Load sketches saved with save_sketches"""
+    states = {}
+    with np.load(path) as archive:
+        for key in archive.files:
+            name, field = key.split('__', 1)
+            states.setdefault(name, {})[field] = archive[key]
+
+    sketches = {}
+    for name, state in states.items():
+        kind = str(state['kind'])
+        sketches[name] = HyperLogLog.from_state(state) if kind == 'hll' else GroupedDistinctCounter.from_state(state)
+    return sketches
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Micro-Batch Ingestion
+==================================
+
+Long-running service for near-real-time updates of the Power BI summaries:
+- Watches a local drop directory for new POS export CSV files; a file is
+  picked up once it has not changed for settle_seconds (writers can also
+  write name.csv.tmp and rename it, only *.csv names are read)
+- Optionally accepts CSV rows on a local TCP socket (header line first)
+- Runs each micro-batch through clean_data / create_features; files move
+  to processed/ only after their batch succeeded, failing batches go to failed/
+- Folds the batch into running aggregates and rewrites the summary
+  tables in place (atomic file replace); the aggregates are saved next to
+  the tables and reloaded on restart, and can be seeded from the processed
+  data of a full batch run
+- Exposes latency and throughput metrics (ingestion_metrics.json)
+
+Everything runs on the local machine, so the service can be exercised
+offline with run_once().
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import argparse
+import contextlib
+import copy
+import csv
+import glob
+import io
+import json
+import os
+import queue
+import shutil
+import socketserver
+import threading
+import time
+import pandas as pd
+from coffee_sales_preprocessing import CoffeeSalesPreprocessor, iqr_bounds
+from coffee_sales_partitions import read_partitioned
+
+SUMMARY_AGGREGATIONS = {
+    'count': 'sum',
+    'sales': 'sum',
+    'sales_min': 'min',
+    'sales_max': 'max',
+    'qty': 'sum',
+    'price_sum': 'sum'
+}
+
+SUMMARY_FILES = ['store_summary.csv', 'category_summary.csv', 'time_summary.csv', 'daily_trends.csv']
+STATE_FILE = 'summary_state.pkl'
+SUMMARY_COLUMNS = ['transaction_id', 'transaction_date', 'transaction_qty', 'unit_price', 'total_amount',
+                   'store_location', 'product_category', 'product_id', 'time_period']
+
+
+class SummaryState:
+    """Mergeable running aggregates behind the store/category/time/daily summary tables"""
+
+    def __init__(self):
+        self.aggregates = {}
+        self.product_pairs = {}
+
+    def _accumulate(self, name, batch, key):
+        partial = batch.groupby(key, observed=True).agg(
+            count=('transaction_id', 'count'),
+            sales=('total_amount', 'sum'),
+            sales_min=('total_amount', 'min'),
+            sales_max=('total_amount', 'max'),
+            qty=('transaction_qty', 'sum'),
+            price_sum=('unit_price', 'sum')
+        )
+        previous = self.aggregates.get(name)
+        if previous is not None:
+            partial = pd.concat([previous, partial]).groupby(level=0).agg(SUMMARY_AGGREGATIONS)
+        self.aggregates[name] = partial
+
+    def _accumulate_products(self, name, batch, key):
+        # Distinct (group, product) pairs are bounded by groups x catalog size
+        pairs = batch[[key, 'product_id']].drop_duplicates()
+        previous = self.product_pairs.get(name)
+        if previous is not None:
+            pairs = pd.concat([previous, pairs]).drop_duplicates()
+        self.product_pairs[name] = pairs
+
+    def updated(self, batch):
+        """Return a new state with a transformed batch folded in; self is left unchanged"""
+        state = SummaryState()
+        state.aggregates, state.product_pairs = dict(self.aggregates), dict(self.product_pairs)
+        state._accumulate('store', batch, 'store_location')
+        state._accumulate('category', batch, 'product_category')
+        state._accumulate('time', batch, 'time_period')
+        state._accumulate('daily', batch, 'transaction_date')
+        state._accumulate_products('store', batch, 'store_location')
+        state._accumulate_products('category', batch, 'product_category')
+        return state
+
+    def update(self, batch):
+        """Fold a transformed batch into the running aggregates (all or nothing)"""
+        state = self.updated(batch)
+        self.aggregates, self.product_pairs = state.aggregates, state.product_pairs
+        return self
+
+    @classmethod
+    def from_processed(cls, source):
+        """Build the state from the processed data of a full batch run
+
+        source is a DataFrame, a processed CSV file or a partitioned dataset directory.
+        """
+        if isinstance(source, pd.DataFrame):
+            data = source[SUMMARY_COLUMNS]
+        elif os.path.isdir(source):
+            data = read_partitioned(source, columns=SUMMARY_COLUMNS)
+        else:
+            data = pd.read_csv(source, usecols=SUMMARY_COLUMNS)
+        # Same daily keys as the micro-batches, which carry parsed dates
+        data = data.assign(transaction_date=pd.to_datetime(data['transaction_date'], errors='coerce'))
+        return cls().update(data)
+
+    def save(self, path):
+        pd.to_pickle({'aggregates': self.aggregates, 'product_pairs': self.product_pairs}, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        saved = pd.read_pickle(path)
+        state = cls()
+        state.aggregates, state.product_pairs = saved['aggregates'], saved['product_pairs']
+        return state
+
+    def _unique_products(self, name, key):
+        return self.product_pairs[name].groupby(key)['product_id'].nunique()
+
+    def tables(self):
+        """Build the summary tables with the same layout as create_aggregated_tables"""
+        store = self.aggregates['store']
+        store_summary = pd.DataFrame({
+            'TransactionCount': store['count'],
+            'TotalSales': store['sales'],
+            'AvgSale': store['sales'] / store['count'],
+            'MinSale': store['sales_min'],
+            'MaxSale': store['sales_max'],
+            'TotalQuantity': store['qty'],
+            'AvgUnitPrice': store['price_sum'] / store['count']
+        }).round(2)
+        store_summary['UniqueProducts'] = self._unique_products('store', 'store_location')
+        store_summary['AvgTransactionValue'] = (store_summary['TotalSales'] / store_summary['TransactionCount']).round(2)
+        store_summary.index.name = 'store_location'
+
+        category = self.aggregates['category']
+        category_summary = pd.DataFrame({
+            'TransactionCount': category['count'],
+            'TotalSales': category['sales'],
+            'AvgSale': category['sales'] / category['count'],
+            'TotalQuantity': category['qty'],
+            'AvgUnitPrice': category['price_sum'] / category['count']
+        }).round(2)
+        category_summary['UniqueProducts'] = self._unique_products('category', 'product_category')
+        category_summary['CategoryShare'] = (category_summary['TotalSales'] / category_summary['TotalSales'].sum() * 100).round(2)
+        category_summary.index.name = 'product_category'
+
+        time_agg = self.aggregates['time']
+        time_summary = pd.DataFrame({
+            'TransactionCount': time_agg['count'],
+            'TotalSales': time_agg['sales'],
+            'AvgSale': time_agg['sales'] / time_agg['count'],
+            'TotalQuantity': time_agg['qty']
+        }).round(2)
+        time_summary['TimeShare'] = (time_summary['TotalSales'] / time_summary['TotalSales'].sum() * 100).round(2)
+        time_summary.index.name = 'time_period'
+
+        daily = self.aggregates['daily'].sort_index()
+        daily_trends = pd.DataFrame({
+            'Date': daily.index,
+            'TransactionCount': daily['count'].to_numpy(),
+            'TotalSales': daily['sales'].to_numpy(),
+            'TotalQuantity': daily['qty'].to_numpy()
+        })
+        daily_trends['AvgTransactionValue'] = (daily_trends['TotalSales'] / daily_trends['TransactionCount']).round(2)
+
+        return store_summary, category_summary, time_summary, daily_trends
+
+
+class _RowHandler(socketserver.StreamRequestHandler):
+    """Reads CSV rows (header line first) from a client and queues them"""
+
+    def handle(self):
+        lines = (line.decode('utf-8') for line in self.rfile)
+        for row in csv.DictReader(lines):
+            self.server.rows.put(row)
+
+
+class _RowServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MicroBatchIngestionService:
+    """Micro-batches new transactions from a drop directory / socket into the summary tables
+
+    The running aggregates are saved to output_dir after every batch and
+    reloaded on start. Summary tables in output_dir that the service did not
+    build are never overwritten: pass seed_from (the processed data of the
+    batch run) to take them over.
+    """
+
+    def __init__(self, drop_dir, output_dir='.', batch_interval=5.0, socket_port=None,
+                 outlier_bounds=None, seed_from=None, settle_seconds=None, quiet=True):
+        self.drop_dir = drop_dir
+        self.processed_dir = os.path.join(drop_dir, 'processed')
+        self.failed_dir = os.path.join(drop_dir, 'failed')
+        self.output_dir = output_dir
+        self.batch_interval = batch_interval
+        self.settle_seconds = batch_interval if settle_seconds is None else settle_seconds
+        self.socket_port = socket_port
+        self.quiet = quiet
+        self.state_path = os.path.join(output_dir, STATE_FILE)
+        self.preprocessor = CoffeeSalesPreprocessor(
+            profile_path=os.path.join(output_dir, 'data_quality_profile.csv'),
+            quarantine_path=os.path.join(output_dir, 'coffee_sales_quarantine.csv'))
+        if outlier_bounds:
+            self.preprocessor.outlier_bounds = dict(outlier_bounds)
+        self.rows = queue.Queue()
+        self._server = None
+        self._stop = threading.Event()
+        self._metrics = {
+            'batches': 0,
+            'failed_batches': 0,
+            'rows_received': 0,
+            'rows_ingested': 0,
+            'files_ingested': 0,
+            'processing_seconds': 0.0,
+            'last_batch_latency_seconds': None,
+            'max_batch_latency_seconds': 0.0,
+            'last_freshness_seconds': None,
+            'last_batch_at': None
+        }
+        os.makedirs(self.processed_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.state = self._initial_state(seed_from)
+
+    def _initial_state(self, seed_from):
+        """Seeded, saved or empty state; refuses to take over summaries it did not build"""
+        if seed_from is not None:
+            state = SummaryState.from_processed(seed_from)
+            self._write_tables(state)
+            state.save(self.state_path)
+            return state
+        if os.path.exists(self.state_path):
+            return SummaryState.load(self.state_path)
+        existing = [name for name in SUMMARY_FILES if os.path.exists(os.path.join(self.output_dir, name))]
+        if existing:
+            raise FileExistsError(
+                f"{', '.join(existing)} in {self.output_dir} were not built by the ingestion service; "
+                "seed it from the processed data (seed_from / --seed-from) or use another output directory")
+        return SummaryState()
+
+    def start_socket(self):
+        """Accept CSV rows on 127.0.0.1:socket_port in a background thread"""
+        self._server = _RowServer(('127.0.0.1', self.socket_port), _RowHandler)
+        self._server.rows = self.rows
+        self.socket_port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.socket_port
+
+    def _collect(self):
+        """Gather new drop-directory files and queued socket rows into one raw batch
+
+        Returns (raw, arrived_at, paths, socket_frame); the files stay in the
+        drop directory until the batch has been processed.
+        """
+        frames, arrivals, paths = [], [], []
+        now = time.time()
+        for path in sorted(glob.glob(os.path.join(self.drop_dir, '*.csv')), key=os.path.getmtime):
+            # A file still being written keeps changing; leave it for a later batch
+            if now - os.path.getmtime(path) < self.settle_seconds:
+                continue
+            try:
+                frames.append(pd.read_csv(path))
+            except Exception as e:
+                print(f"❌ Error reading {path}: {e}")
+                self._move([path], self.failed_dir)
+                continue
+            arrivals.append(os.path.getmtime(path))
+            paths.append(path)
+
+        socket_frame = None
+        socket_rows = []
+        while True:
+            try:
+                socket_rows.append(self.rows.get_nowait())
+            except queue.Empty:
+                break
+        if socket_rows:
+            # Round-trip through read_csv so socket rows get the same dtypes as files
+            text = pd.DataFrame(socket_rows).to_csv(index=False)
+            socket_frame = pd.read_csv(io.StringIO(text))
+            frames.append(socket_frame)
+            arrivals.append(time.time())
+
+        if not frames:
+            return None, None, [], None
+        return pd.concat(frames, ignore_index=True), min(arrivals), paths, socket_frame
+
+    def _move(self, paths, directory):
+        for path in paths:
+            shutil.move(path, os.path.join(directory, os.path.basename(path)))
+
+    def _snapshot(self):
+        """Preprocessor state a failing batch must not leave behind"""
+        p = self.preprocessor
+        quarantine_size = os.path.getsize(p.quarantine_path) if os.path.exists(p.quarantine_path) else None
+        return {'profiler': copy.deepcopy(p.profiler), 'outlier_samples': dict(p.outlier_samples),
+                'outlier_seen': dict(p.outlier_seen), 'rng': p.rng.bit_generator.state,
+                'quarantine_size': quarantine_size}
+
+    def _rollback(self, snapshot):
+        """Undo a failed batch so replaying it from failed/ does not count it twice"""
+        p = self.preprocessor
+        p.profiler = snapshot['profiler']
+        p.outlier_samples, p.outlier_seen = snapshot['outlier_samples'], snapshot['outlier_seen']
+        p.rng.bit_generator.state = snapshot['rng']
+        try:
+            if snapshot['quarantine_size'] is None:
+                if os.path.exists(p.quarantine_path):
+                    os.remove(p.quarantine_path)
+            else:
+                with open(p.quarantine_path, 'r+b') as f:
+                    f.truncate(snapshot['quarantine_size'])
+            if p.profiler is not None:
+                p.quality_profile = p.profiler.report()
+                p.quality_profile.to_csv(p.profile_path)
+            elif os.path.exists(p.profile_path):
+                os.remove(p.profile_path)
+            if self.state.aggregates:
+                self._write_tables(self.state)
+        except Exception as e:
+            print(f"⚠️ Could not restore the outputs of the failed batch: {e}")
+
+    def process_batch(self, raw, arrived_at=None):
+        """Clean, transform and fold one raw batch into the summaries
+
+        All state changes of a failing batch are rolled back before the error is raised.
+        """
+        started = time.perf_counter()
+        snapshot = self._snapshot()
+        try:
+            output = io.StringIO() if self.quiet else None
+            with contextlib.redirect_stdout(output) if self.quiet else contextlib.nullcontext():
+                self.preprocessor.sales_df = raw
+                self.preprocessor.clean_data(incremental=True)
+                self.preprocessor.create_features()
+            batch = self.preprocessor.transformed_df
+
+            # The in-memory state only changes once the tables and the saved state are written
+            state = self.state
+            if len(batch):
+                state = self.state.updated(batch)
+                self._write_tables(state)
+                state.save(self.state_path)
+        except Exception:
+            self._rollback(snapshot)
+            raise
+        self.state = state
+
+        latency = time.perf_counter() - started
+        metrics = self._metrics
+        metrics['batches'] += 1
+        metrics['rows_received'] += len(raw)
+        metrics['rows_ingested'] += len(batch)
+        metrics['processing_seconds'] += latency
+        metrics['last_batch_latency_seconds'] = round(latency, 4)
+        metrics['max_batch_latency_seconds'] = round(max(metrics['max_batch_latency_seconds'], latency), 4)
+        if arrived_at is not None:
+            metrics['last_freshness_seconds'] = round(time.time() - arrived_at, 4)
+        metrics['last_batch_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self._write_json('ingestion_metrics.json', self.metrics())
+        except OSError as e:
+            print(f"⚠️ Could not write ingestion metrics: {e}")
+        return batch
+
+    def run_once(self):
+        """Process everything that is waiting right now; returns the number of rows ingested"""
+        raw, arrived_at, paths, socket_frame = self._collect()
+        if raw is None:
+            return 0
+        try:
+            batch = self.process_batch(raw, arrived_at)
+        except Exception as e:
+            # Keep the inputs of a failing batch for inspection and replay
+            print(f"❌ Batch of {len(raw)} rows failed, moved to {self.failed_dir}: {type(e).__name__}: {e}")
+            self._move(paths, self.failed_dir)
+            if socket_frame is not None:
+                socket_frame.to_csv(os.path.join(self.failed_dir, f'socket_rows_{time.strftime("%Y%m%d_%H%M%S")}.csv'),
+                                    index=False)
+            self._metrics['failed_batches'] += 1
+            self._write_json('ingestion_metrics.json', self.metrics())
+            return 0
+
+        self._move(paths, self.processed_dir)
+        self._metrics['files_ingested'] += len(paths)
+        return len(batch)
+
+    def run(self):
+        """Poll for new data every batch_interval seconds until stop() is called"""
+        if self.socket_port is not None and self._server is None:
+            port = self.start_socket()
+            print(f"🔌 Accepting CSV rows on 127.0.0.1:{port}")
+        print(f"👀 Watching {self.drop_dir} (batch interval: {self.batch_interval}s)")
+        while not self._stop.is_set():
+            try:
+                ingested = self.run_once()
+            except Exception as e:
+                # e.g. the drop directory is briefly unavailable; try again next interval
+                print(f"❌ Ingestion error: {type(e).__name__}: {e}")
+                ingested = 0
+            if ingested:
+                m = self.metrics()
+                print(f"  Batch {m['batches']}: {ingested} rows in {m['last_batch_latency_seconds']:.2f}s "
+                      f"({m['throughput_rows_per_second']:,.0f} rows/s overall)")
+            self._stop.wait(self.batch_interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def metrics(self):
+        """Return latency and throughput metrics"""
+        metrics = dict(self._metrics)
+        seconds = metrics['processing_seconds']
+        metrics['throughput_rows_per_second'] = round(metrics['rows_ingested'] / seconds, 2) if seconds else 0.0
+        metrics['pending_socket_rows'] = self.rows.qsize()
+        return metrics
+
+    def _write_tables(self, state):
+        store_summary, category_summary, time_summary, daily_trends = state.tables()
+        self._write_csv(store_summary, 'store_summary.csv', index=True)
+        self._write_csv(category_summary, 'category_summary.csv', index=True)
+        self._write_csv(time_summary, 'time_summary.csv', index=True)
+        self._write_csv(daily_trends, 'daily_trends.csv', index=False)
+
+    def _write_csv(self, table, name, index):
+        # Write then rename so Power BI never reads a half-written file
+        path = os.path.join(self.output_dir, name)
+        table.to_csv(path + '.tmp', index=index)
+        os.replace(path + '.tmp', path)
+
+    def _write_json(self, name, payload):
+        path = os.path.join(self.output_dir, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(payload, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Micro-batch ingestion of coffee sales POS exports')
+    parser.add_argument('drop_dir', help='Directory where POS exports are dropped')
+    parser.add_argument('--output-dir', default='.', help='Directory for the summary tables')
+    parser.add_argument('--interval', type=float, default=5.0, help='Seconds between micro-batches')
+    parser.add_argument('--port', type=int, default=None, help='Also accept CSV rows on this local port')
+    parser.add_argument('--bounds-from', default=None,
+                        help='Historical sales CSV to fix the IQR outlier bounds from '
+                             '(default: running quantiles over the batches seen so far)')
+    parser.add_argument('--seed-from', default=None,
+                        help='Processed data of a full batch run (CSV or partitioned dataset) to start the '
+                             'summaries from; required once if the output directory already has summary tables')
+    parser.add_argument('--settle', type=float, default=None,
+                        help='Seconds a drop file must be unchanged before it is read (default: --interval)')
+    args = parser.parse_args()
+
+    outlier_bounds = None
+    if args.bounds_from:
+        history = pd.read_csv(args.bounds_from, usecols=['transaction_qty', 'unit_price'])
+        outlier_bounds = {col: iqr_bounds(pd.to_numeric(history[col], errors='coerce')) for col in history.columns}
+        print(f"📏 Outlier bounds from {args.bounds_from}: {outlier_bounds}")
+
+    service = MicroBatchIngestionService(args.drop_dir, output_dir=args.output_dir,
+                                         batch_interval=args.interval, socket_port=args.port,
+                                         outlier_bounds=outlier_bounds, seed_from=args.seed_from,
+                                         settle_seconds=args.settle)
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        service.stop()
+        print("\n🛑 Ingestion stopped.")
+        print(json.dumps(service.metrics(), indent=2))
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coffee Sales Hyperparameter Tuning
+==================================
+
+Budget-aware hyperparameter search for the sales models:
+- Successive halving: every candidate is scored on a small recent slice of
+  the data, only the best 1/eta move on to a larger slice
+- Time-series CV folds (TimeSeriesSplit) on chronologically ordered rows
+- Every round scores its candidates on its own process pool; workers still
+  running when the wall-clock budget is spent are terminated
+- Tuned configs are cached in JSON per model, grid, feature list and row-count
+  bucket, and reused until they are older than max_cache_age_days
+
+Author: Data Analyst
+Date: 2024
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import queue
+import time
+import numpy as np
+from sklearn.model_selection import ParameterGrid, TimeSeriesSplit, cross_val_score
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.linear_model import Ridge, Lasso
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+
+MODEL_CLASSES = {
+    'Random Forest': RandomForestRegressor,
+    'Gradient Boosting': GradientBoostingRegressor,
+    'Ridge Regression': Ridge,
+    'Lasso Regression': Lasso
+}
+
+PARAM_GRIDS = {
+    'Random Forest': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 10, 20],
+        'min_samples_leaf': [1, 5]
+    },
+    'Gradient Boosting': {
+        'n_estimators': [100, 200],
+        'learning_rate': [0.05, 0.1],
+        'max_depth': [3, 5]
+    },
+    'Ridge Regression': {'alpha': [0.01, 0.1, 1.0, 10.0, 100.0]},
+    'Lasso Regression': {'alpha': [0.001, 0.01, 0.1, 1.0]}
+}
+
+CLUSTER_CANDIDATES = [2, 3, 4, 5, 6, 7, 8]
+
+
+def _score_candidate(model_name, params, X, y, n_splits, random_state):
+    """Mean time-series CV score (negative RMSE) of one candidate; runs in a worker process"""
+    model_class = MODEL_CLASSES[model_name]
+    if 'random_state' in model_class().get_params():
+        params = {**params, 'random_state': random_state}
+    scores = cross_val_score(model_class(**params), X, y, cv=TimeSeriesSplit(n_splits=n_splits),
+                             scoring='neg_root_mean_squared_error', n_jobs=1)
+    return float(np.mean(scores))
+
+
+def _score_clusters(n_clusters, X, random_state):
+    """Silhouette score of a KMeans fit; runs in a worker process"""
+    labels = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10).fit_predict(X)
+    sample_size = min(len(X), 10000)
+    return float(silhouette_score(X, labels, sample_size=sample_size, random_state=random_state))
+
+
+def data_descriptor(X, feature_names=None):
+    """Coarse description of the training data used as part of the cache key
+
+    Feature list plus a power-of-two row-count bucket, so a few new days of
+    data still reuse the tuned config while a different feature set or a
+    much larger dataset does not.
+    """
+    n_rows, n_features = np.shape(X)
+    features = list(feature_names) if feature_names is not None else n_features
+    return f"features={json.dumps(features)}|rows~2^{int(math.log2(max(n_rows, 1)))}"
+
+
+class SuccessiveHalvingTuner:
+    """Successive-halving search over PARAM_GRIDS on a bounded process pool"""
+
+    def __init__(self, time_budget=300, n_workers=None, eta=3, min_samples=2000, n_splits=3,
+                 cache_path='tuned_hyperparameters.json', max_cache_age_days=30, retune=False,
+                 random_state=42):
+        self.time_budget = time_budget
+        self.n_workers = n_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.eta = eta
+        self.min_samples = min_samples
+        self.n_splits = n_splits
+        self.cache_path = cache_path
+        self.max_cache_age_days = max_cache_age_days
+        self.retune = retune
+        self.random_state = random_state
+        self.cache = self._load_cache()
+        self.history = []
+        self._deadline = time.monotonic() + time_budget
+
+    def _load_cache(self):
+        if self.cache_path and os.path.exists(self.cache_path):
+            with open(self.cache_path) as f:
+                return json.load(f)
+        return {}
+
+    def _save_cache(self):
+        if self.cache_path:
+            with open(self.cache_path, 'w') as f:
+                json.dump(self.cache, f, indent=2)
+
+    def _cache_key(self, name, grid, descriptor):
+        return f"{name}|{json.dumps(grid, sort_keys=True)}|{descriptor}"
+
+    def _cached(self, name, key):
+        """Cached params for key, unless retuning or the entry is too old"""
+        entry = self.cache.get(key)
+        if self.retune or not isinstance(entry, dict) or 'params' not in entry:
+            return None
+        age_days = (time.time() - entry.get('tuned_at', 0)) / 86400
+        if self.max_cache_age_days is not None and age_days > self.max_cache_age_days:
+            return None
+        print(f"  {name}: using cached config {entry['params']} (tuned {age_days:.1f} days ago)")
+        return entry['params']
+
+    def _store(self, key, params):
+        self.cache[key] = {'params': params, 'tuned_at': time.time()}
+        self._save_cache()
+
+    def __enter__(self):
+        self._deadline = time.monotonic() + self.time_budget
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _remaining(self):
+        return max(0.0, self._deadline - time.monotonic())
+
+    def _run_round(self, jobs):
+        """Score (candidate, fn, args) jobs on a fresh pool until done or out of budget
+
+        The pool is terminated afterwards, so candidates still running at the
+        deadline do not keep the workers busy during later rounds or models.
+        """
+        results = queue.Queue()
+        pool = multiprocessing.Pool(processes=max(1, min(self.n_workers, len(jobs))))
+        try:
+            for candidate, fn, args in jobs:
+                pool.apply_async(fn, args,
+                                 callback=lambda score, c=candidate: results.put((score, c, None)),
+                                 error_callback=lambda e, c=candidate: results.put((None, c, e)))
+            scores = []
+            for _ in range(len(jobs)):
+                if self._remaining() <= 0:
+                    break
+                try:
+                    score, candidate, error = results.get(timeout=self._remaining())
+                except queue.Empty:
+                    break
+                if error is not None:
+                    print(f"  ⚠️ Candidate {candidate} failed: {error}")
+                else:
+                    scores.append((score, candidate))
+        finally:
+            pool.terminate()
+            pool.join()
+        return scores
+
+    def tune(self, name, X, y, feature_names=None):
+        """Return the best params for one model; X and y must be in chronological order"""
+        grid = PARAM_GRIDS[name]
+        key = self._cache_key(name, grid, data_descriptor(X, feature_names))
+        cached = self._cached(name, key)
+        if cached is not None:
+            return cached
+
+        X, y = np.asarray(X), np.asarray(y)
+        candidates = list(ParameterGrid(grid))
+        best_params, n_samples, rounds = None, self.min_samples, 0
+        complete = False
+
+        while candidates and self._remaining() > 0:
+            # Most recent rows so every fold respects time order
+            n = min(len(X), n_samples)
+            X_round, y_round = X[-n:], y[-n:]
+            jobs = [(params, _score_candidate, (name, params, X_round, y_round, self.n_splits, self.random_state))
+                    for params in candidates]
+            scores = self._run_round(jobs)
+            if not scores:
+                break
+
+            scores.sort(key=lambda item: item[0], reverse=True)
+            best_params = scores[0][1]
+            rounds += 1
+            self.history.append({'model': name, 'round': rounds, 'samples': n,
+                                 'candidates': len(candidates), 'best_score': scores[0][0]})
+
+            if n >= len(X) or len(candidates) == 1:
+                complete = len(scores) == len(candidates)
+                break
+            keep = max(1, math.ceil(len(scores) / self.eta))
+            candidates = [params for _, params in scores[:keep]]
+            n_samples *= self.eta
+
+        if best_params is None:
+            print(f"  {name}: budget exhausted before any candidate finished, keeping defaults")
+            return {}
+
+        # Only cache searches that ran to completion so a short budget does not stick
+        if complete:
+            self._store(key, best_params)
+        print(f"  {name}: best config {best_params} after {rounds} round(s)")
+        return best_params
+
+    def tune_models(self, names, X, y, reserve=0.0, feature_names=None):
+        """Tune several models one after another, splitting the remaining budget between them
+
+        X is one feature matrix for all models or a dict of matrices keyed by model name.
+        `reserve` seconds of the budget are held back for later searches (e.g. clusters).
+        """
+        tuned = {}
+        for i, name in enumerate(names):
+            available = max(0.0, self._remaining() - reserve)
+            model_deadline = time.monotonic() + available / (len(names) - i)
+            overall_deadline, self._deadline = self._deadline, model_deadline
+            try:
+                tuned[name] = self.tune(name, X[name] if isinstance(X, dict) else X, y, feature_names)
+            finally:
+                self._deadline = overall_deadline
+        return tuned
+
+    def tune_clusters(self, X, candidates=CLUSTER_CANDIDATES, sample_size=20000, feature_names=None):
+        """Pick the KMeans cluster count with the best silhouette score"""
+        key = self._cache_key('KMeans', {'n_clusters': list(candidates)}, data_descriptor(X, feature_names))
+        cached = self._cached('KMeans', key)
+        if cached is not None:
+            return cached
+
+        X = np.asarray(X)
+        if len(X) > sample_size:
+            X = X[np.random.default_rng(self.random_state).choice(len(X), sample_size, replace=False)]
+        jobs = [({'n_clusters': k}, _score_clusters, (k, X, self.random_state)) for k in candidates]
+        scores = self._run_round(jobs)
+        if not scores:
+            print("  KMeans: budget exhausted before any candidate finished, keeping defaults")
+            return {}
+
+        best_score, best_params = max(scores, key=lambda item: item[0])
+        if len(scores) == len(candidates):
+            self._store(key, best_params)
+        print(f"  KMeans: best config {best_params} (silhouette {best_score:.3f})")
+        return best_params
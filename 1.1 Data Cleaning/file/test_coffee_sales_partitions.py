@@ -0,0 +1,53 @@
+"""Smoke tests for the partitioned dataset layout (run with pytest)"""
+
+import os
+import pandas as pd
+from coffee_sales_partitions import write_partitioned, list_partitions, read_partitioned
+
+
+def march_rows(stores=(3, 5), days=range(1, 32), amount=1.0):
+    return pd.DataFrame([
+        {'transaction_date': f'2023-03-{day:02d}', 'store_id': store, 'total_amount': amount}
+        for day in days for store in stores
+    ])
+
+
+def test_filtered_rewrite_keeps_rows_outside_the_filter(tmp_path):
+    root = str(tmp_path / 'dataset')
+    write_partitioned(march_rows(), root)
+
+    rerun = march_rows(stores=(3,), days=range(10, 13), amount=2.0)
+    write_partitioned(rerun, root, start_date='2023-03-10', end_date='2023-03-15', store_ids=[3])
+
+    march = read_partitioned(root)
+    assert len(march) == 62 - 6 + 3
+    assert march['total_amount'].sum() == 62 - 6 + 3 * 2.0
+
+
+def test_interrupted_swap_is_recovered(tmp_path):
+    root = str(tmp_path / 'dataset')
+    write_partitioned(march_rows(), root)
+    month = os.path.join(root, 'year=2023', 'month=3')
+
+    # As if the previous run died after moving the old partition aside
+    os.replace(month, month + '.old')
+    assert len(read_partitioned(root)) == 62
+
+    rerun = march_rows(stores=(3,), days=range(10, 13), amount=2.0)
+    write_partitioned(rerun, root, start_date='2023-03-10', end_date='2023-03-15', store_ids=[3])
+    assert len(read_partitioned(root)) == 62 - 6 + 3
+    assert not os.path.exists(month + '.old')
+
+
+def test_partitions_are_listed_in_date_order(tmp_path):
+    root = str(tmp_path / 'dataset')
+    dates = ['2024-01-05', '2023-10-05', '2023-02-05', '2023-03-05']
+    write_partitioned(pd.DataFrame({'transaction_date': dates, 'store_id': 3}), root)
+    os.makedirs(os.path.join(root, 'year=2023', 'month=4.staging'))
+    pd.DataFrame({'transaction_date': ['2023-04-01']}).to_csv(
+        os.path.join(root, 'year=2023', 'month=4.staging', 'part-00000.csv'), index=False)
+
+    partitions = list_partitions(root)
+    assert list(zip(partitions['year'], partitions['month'])) == [
+        ('2023', '2'), ('2023', '3'), ('2023', '10'), ('2024', '1')]
+    assert list(read_partitioned(root)['transaction_date']) == sorted(dates)
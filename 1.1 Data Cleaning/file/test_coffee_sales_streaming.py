@@ -0,0 +1,106 @@
+"""Offline tests for the micro-batch ingestion service (run with pytest)"""
+
+import os
+import pandas as pd
+import pytest
+from coffee_sales_streaming import MicroBatchIngestionService
+
+BOUNDS = {'transaction_qty': (0, 10), 'unit_price': (0, 50)}
+
+
+def raw_rows(first_id, n, store='Astoria', qty=2, price=3.0):
+    return pd.DataFrame({
+        'transaction_id': range(first_id, first_id + n),
+        'transaction_date': '2023-03-01',
+        'transaction_time': '08:15:00',
+        'transaction_qty': qty,
+        'store_id': 3,
+        'store_location': store,
+        'product_id': range(first_id, first_id + n),
+        'unit_price': price,
+        'product_category': 'Coffee',
+        'product_type': 'Latte',
+        'product_detail': 'Latte Rg'
+    })
+
+
+def make_service(tmp_path, **kwargs):
+    return MicroBatchIngestionService(str(tmp_path / 'drop'), output_dir=str(tmp_path / 'out'),
+                                      settle_seconds=0, outlier_bounds=BOUNDS, **kwargs)
+
+
+def store_summary(tmp_path):
+    return pd.read_csv(tmp_path / 'out' / 'store_summary.csv', index_col='store_location')
+
+
+def test_files_and_socket_rows_are_ingested(tmp_path):
+    service = make_service(tmp_path)
+    raw_rows(1, 3).to_csv(tmp_path / 'drop' / 'a.csv', index=False)
+    raw_rows(4, 2, store='Hell\'s Kitchen', qty=1, price=4.0).to_csv(tmp_path / 'drop' / 'b.csv', index=False)
+    for row in raw_rows(6, 2).astype(str).to_dict('records'):
+        service.rows.put(row)
+
+    assert service.run_once() == 7
+
+    summary = store_summary(tmp_path)
+    assert summary.loc['Astoria', 'TransactionCount'] == 5
+    assert summary.loc['Astoria', 'TotalSales'] == pytest.approx(30.0)
+    assert summary.loc["Hell's Kitchen", 'TotalSales'] == pytest.approx(8.0)
+    assert sorted(os.listdir(tmp_path / 'drop' / 'processed')) == ['a.csv', 'b.csv']
+    assert not list((tmp_path / 'drop').glob('*.csv'))
+    assert service.metrics()['files_ingested'] == 2
+
+
+def test_failed_batch_is_moved_and_not_counted(tmp_path):
+    service = make_service(tmp_path)
+    raw_rows(1, 3).to_csv(tmp_path / 'drop' / 'a.csv', index=False)
+    service.run_once()
+
+    raw_rows(4, 2).drop(columns=['store_location']).to_csv(tmp_path / 'drop' / 'bad.csv', index=False)
+    assert service.run_once() == 0
+    assert os.listdir(tmp_path / 'drop' / 'failed') == ['bad.csv']
+    assert service.metrics()['failed_batches'] == 1
+    assert store_summary(tmp_path).loc['Astoria', 'TransactionCount'] == 3
+
+    # The loop keeps going with the next good file
+    raw_rows(10, 1).to_csv(tmp_path / 'drop' / 'c.csv', index=False)
+    assert service.run_once() == 1
+    assert store_summary(tmp_path).loc['Astoria', 'TransactionCount'] == 4
+
+
+def test_restart_keeps_the_aggregates(tmp_path):
+    make_service(tmp_path)
+    raw_rows(1, 3).to_csv(tmp_path / 'drop' / 'a.csv', index=False)
+    make_service(tmp_path).run_once()
+
+    restarted = make_service(tmp_path)
+    raw_rows(4, 2).to_csv(tmp_path / 'drop' / 'b.csv', index=False)
+    restarted.run_once()
+    assert store_summary(tmp_path).loc['Astoria', 'TransactionCount'] == 5
+
+
+def test_foreign_summaries_are_not_overwritten(tmp_path):
+    os.makedirs(tmp_path / 'out')
+    pd.DataFrame({'store_location': ['Astoria'], 'TransactionCount': [6618]}).to_csv(
+        tmp_path / 'out' / 'store_summary.csv', index=False)
+    with pytest.raises(FileExistsError):
+        make_service(tmp_path)
+
+
+def test_seed_from_processed_data(tmp_path):
+    processed = raw_rows(1, 4).assign(total_amount=6.0, time_period='Morning')
+    service = make_service(tmp_path, seed_from=processed)
+    raw_rows(5, 1).to_csv(tmp_path / 'drop' / 'a.csv', index=False)
+    service.run_once()
+
+    summary = store_summary(tmp_path)
+    assert summary.loc['Astoria', 'TransactionCount'] == 5
+    assert summary.loc['Astoria', 'TotalSales'] == pytest.approx(30.0)
+
+
+def test_files_still_being_written_wait(tmp_path):
+    service = make_service(tmp_path)
+    service.settle_seconds = 60
+    raw_rows(1, 3).to_csv(tmp_path / 'drop' / 'a.csv', index=False)
+    assert service.run_once() == 0
+    assert os.path.exists(tmp_path / 'drop' / 'a.csv')